@@ -0,0 +1,95 @@
+"""Background purge of deleted accounts.
+
+DELETE /users/me only deactivates the user and records an AccountDeletion row;
+purge_account then removes the dependent rows table by table in bounded
+chunks, committing after each chunk together with its progress. Every step
+is an idempotent "delete up to N remaining rows", so a purge interrupted by a
+crash or restart is finished by resume_pending_deletions on the next start.
+"""
+import logging
+import os
+from datetime import datetime
+
+from sqlalchemy import delete, select, update
+
+from . import models, database, crud
+
+PURGE_CHUNK_SIZE = int(os.getenv("ACCOUNT_PURGE_CHUNK_SIZE", "1000"))
+
+logger = logging.getLogger("app.account_deletion")
+
+# Тәуелді кестелер: алдымен ledger жолдары, сосын санаттар, соңында қолданушы
+PURGE_STAGES = [
+    ("notification_outbox", models.NotificationOutbox),
+    ("budgets", models.Budget),
+    ("expenses", models.Expense),
+    ("incomes", models.Income),
+    ("category_monthly_totals", models.CategoryMonthlyTotal),
+    ("user_balances", models.UserBalance),
+    ("user_data_versions", models.UserDataVersion),
+    ("categories", models.Category),
+]
+
+
+def request_account_deletion(db, user: models.User):
+    user.is_active = False
+    deletion = db.get(models.AccountDeletion, user.id)
+    if deletion is None:
+        db.add(models.AccountDeletion(user_id=user.id, status="pending", rows_deleted=0, started_at=datetime.utcnow()))
+    elif deletion.status == "done":
+        # SQLite өшірілген аккаунттың id-ін жаңа қолданушыға қайта беруі мүмкін
+        deletion.status, deletion.stage, deletion.rows_deleted = "pending", None, 0
+        deletion.started_at, deletion.updated_at, deletion.finished_at = datetime.utcnow(), None, None
+    # Басқа воркерлердегі кэштелген токендер нұсқа өскенін көріп, қолданушыны қайта оқиды
+    crud.bump_auth_version(db, user.id)
+    db.commit()
+
+
+def _delete_chunk(db, model, user_id: int, chunk_size: int) -> int:
+    if "id" in model.__table__.c:
+        ids = select(model.id).where(model.user_id == user_id).limit(chunk_size)
+        return db.execute(delete(model).where(model.id.in_(ids))).rowcount
+    # Rollup кестелері шағын, бастапқы кілті құрама — бір командамен өшіреміз
+    return db.execute(delete(model).where(model.user_id == user_id)).rowcount
+
+
+def _record_progress(db, user_id: int, **values):
+    db.execute(update(models.AccountDeletion).where(models.AccountDeletion.user_id == user_id).values(
+        updated_at=datetime.utcnow(), **values))
+
+
+def purge_account(user_id: int, chunk_size: int = None):
+    chunk_size = chunk_size or PURGE_CHUNK_SIZE
+    db = database.SessionLocal()
+    try:
+        deletion = db.get(models.AccountDeletion, user_id)
+        if deletion is None or deletion.status == "done":
+            return
+        _record_progress(db, user_id, status="running")
+        db.commit()
+        for stage, model in PURGE_STAGES:
+            while True:
+                deleted = _delete_chunk(db, model, user_id, chunk_size)
+                _record_progress(db, user_id, stage=stage,
+                                 rows_deleted=models.AccountDeletion.rows_deleted + deleted)
+                db.commit()
+                if deleted < chunk_size or "id" not in model.__table__.c:
+                    break
+        db.execute(delete(models.User).where(models.User.id == user_id))
+        _record_progress(db, user_id, status="done", stage=None, finished_at=datetime.utcnow())
+        db.commit()
+    except Exception:
+        db.rollback()
+        logger.exception("account purge for user %s failed; it will resume on next start", user_id)
+    finally:
+        db.close()
+
+
+def resume_pending_deletions():
+    db = database.SessionLocal()
+    try:
+        pending = db.scalars(select(models.AccountDeletion.user_id).where(models.AccountDeletion.status != "done")).all()
+    finally:
+        db.close()
+    for user_id in pending:
+        purge_account(user_id)
@@ -0,0 +1,67 @@
+"""Awaitable counterparts of app.crud for AsyncSession.
+
+Each function runs the sync implementation through AsyncSession.run_sync, so
+the queries, rollups and data-version bumps stay defined in one place while
+database IO goes through the async driver without blocking the event loop.
+"""
+import functools
+from sqlalchemy.ext.asyncio import AsyncSession
+from . import crud, schemas
+from .utils import get_password_hash_async
+
+
+def _awaitable(fn):
+    @functools.wraps(fn)
+    async def wrapper(db: AsyncSession, *args, **kwargs):
+        return await db.run_sync(fn, *args, **kwargs)
+    return wrapper
+
+
+# USER
+get_user_by_email = _awaitable(crud.get_user_by_email)
+update_user_password_hash = _awaitable(crud.update_user_password_hash)
+get_auth_version = _awaitable(crud.get_auth_version)
+async def create_user(db: AsyncSession, user: schemas.UserCreate):
+    # Хэштеу CPU-ға ауыр, оны event loop-тан тыс, хэштеу пулында есептейміз
+    hashed_password = await get_password_hash_async(user.password)
+    return await db.run_sync(crud.create_user, user, hashed_password=hashed_password)
+
+# CATEGORY
+create_user_category = _awaitable(crud.create_user_category)
+get_user_categories = _awaitable(crud.get_user_categories)
+get_user_category_rows = _awaitable(crud.get_user_category_rows)
+
+# EXPENSE
+create_user_expense = _awaitable(crud.create_user_expense)
+get_user_expenses_page = _awaitable(crud.get_user_expenses_page)
+get_user_expense_rows_page = _awaitable(crud.get_user_expense_rows_page)
+delete_user_expense = _awaitable(crud.delete_user_expense)
+update_user_expense = _awaitable(crud.update_user_expense)
+update_user_expenses = _awaitable(crud.update_user_expenses)
+delete_user_expenses = _awaitable(crud.delete_user_expenses)
+
+# INCOME
+create_user_income = _awaitable(crud.create_user_income)
+get_user_incomes_page = _awaitable(crud.get_user_incomes_page)
+get_user_income_rows_page = _awaitable(crud.get_user_income_rows_page)
+
+# BULK
+bulk_create_user_expenses = _awaitable(crud.bulk_create_user_expenses)
+bulk_create_user_incomes = _awaitable(crud.bulk_create_user_incomes)
+
+# DATA VERSION
+get_data_version = _awaitable(crud.get_data_version)
+
+# BALANCE & STATS
+get_user_balance = _awaitable(crud.get_user_balance)
+get_expenses_by_category = _awaitable(crud.get_expenses_by_category)
+get_timeseries = _awaitable(crud.get_timeseries)
+
+# SEARCH
+search_user_ledger = _awaitable(crud.search_user_ledger)
+
+# BUDGET
+create_budget = _awaitable(crud.create_budget)
+get_user_budgets = _awaitable(crud.get_user_budgets)
+get_user_budget_rows = _awaitable(crud.get_user_budget_rows)
+get_user_budget_statuses = _awaitable(crud.get_user_budget_statuses)
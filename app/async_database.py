@@ -0,0 +1,49 @@
+import os
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+from starlette.concurrency import run_in_threadpool
+from .database import SQLALCHEMY_DATABASE_URL, DATABASE_REPLICA_URLS, READ_ONLY_OPTIONS, engine_options, install_sqlite_pragmas, replica_router
+
+# Async драйвер: sqlite -> aiosqlite, postgresql -> asyncpg
+def to_async_url(url: str) -> str:
+    if url.startswith("sqlite://"):
+        return url.replace("sqlite://", "sqlite+aiosqlite://", 1)
+    if url.startswith("postgresql://"):
+        return url.replace("postgresql://", "postgresql+asyncpg://", 1)
+    return url
+
+ASYNC_DATABASE_URL = os.getenv("ASYNC_DATABASE_URL") or to_async_url(SQLALCHEMY_DATABASE_URL)
+
+def make_async_engine(url: str):
+    async_engine = create_async_engine(url, **engine_options(url, is_async=True))
+    install_sqlite_pragmas(async_engine.sync_engine)
+    return async_engine
+
+async_engine = make_async_engine(ASYNC_DATABASE_URL)
+# expire_on_commit=False: коммиттен кейін атрибуттарды оқу жасырын IO жасамауы керек
+AsyncSessionLocal = async_sessionmaker(bind=async_engine, autoflush=False, expire_on_commit=False)
+AsyncReadSessionLocal = async_sessionmaker(bind=async_engine.execution_options(**READ_ONLY_OPTIONS), autoflush=False, expire_on_commit=False)
+
+# Реплика таңдауын синхронды replica_router жасайды (денсаулық тексеруі сонда),
+# әр синхронды репликаға сәйкес async engine осында
+async_replica_engines = {id(sync_replica): make_async_engine(to_async_url(url))
+                         for sync_replica, url in zip(replica_router.replicas, DATABASE_REPLICA_URLS)}
+
+async def get_db():
+    async with AsyncSessionLocal() as db:
+        yield db
+
+async def read_session(pinned: bool = False):
+    replica = await run_in_threadpool(replica_router.pick, pinned)
+    bind = async_replica_engines.get(id(replica), async_engine)
+    db = AsyncSessionLocal(bind=bind.execution_options(**READ_ONLY_OPTIONS))
+    if bind is async_engine:
+        return db
+    try:
+        await db.connection()
+    except DBAPIError:
+        await db.close()
+        replica_router.mark_unhealthy(replica)
+        return await read_session(pinned)
+    db.info["replica"] = replica
+    return db
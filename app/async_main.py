@@ -0,0 +1,281 @@
+"""Async variant of the API: AsyncSession + async def routes.
+
+Run with ``ASYNC_DB=1 ./start.sh`` (or ``uvicorn app.async_main:app``). Hot
+paths (auth, ledger reads/writes, balance, statistics, search, export, budgets)
+are served by the async handlers below; any route not redefined here (profile,
+password, Telegram, account deletion, metrics) falls through to the sync app
+from app.main, so both stacks expose the same API and can be load-tested side
+by side.
+"""
+from contextlib import asynccontextmanager
+from typing import List, Optional
+from datetime import date
+
+from fastapi import FastAPI, Depends, HTTPException, Request, Response, Query
+from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse
+from fastapi.security import OAuth2PasswordRequestForm
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from . import models, schemas, utils, crud, async_crud, main, metrics, database
+from .async_database import get_db, AsyncReadSessionLocal, async_engine, async_replica_engines, read_session
+from .database import replica_router
+from .main import (
+    oauth2_scheme, create_access_token, principal_cache, decode_access_token, remember_principal, apply_data_etag,
+    ledger_filters, read_bulk_rows, batch_selection, json_bytes_response, password_hasher_busy_handler,
+)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    try:
+        async with main.lifespan(app):
+            yield
+    finally:
+        # aiosqlite қосылыстары daemon емес ағындарда жүреді: жабылмаса процесс аяқталмайды
+        await async_engine.dispose()
+        for replica_engine in async_replica_engines.values():
+            await replica_engine.dispose()
+
+app = FastAPI(lifespan=lifespan)
+
+app.add_middleware(
+    CORSMiddleware,
+    allow_origins=["*"],
+    allow_credentials=True,
+    allow_methods=["*"],
+    allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "ETag", database.PIN_HEADER],
+)
+app.add_exception_handler(utils.PasswordHasherBusy, password_hasher_busy_handler)
+app.add_middleware(database.ReadYourWritesMiddleware)
+app.add_middleware(metrics.MetricsMiddleware)
+metrics.install_sql_instrumentation(async_engine.sync_engine)
+for replica_engine in async_replica_engines.values():
+    metrics.install_sql_instrumentation(replica_engine.sync_engine)
+
+
+# --- DEPENDENCIES ---
+async def get_current_user(token: str = Depends(oauth2_scheme)):
+    async with AsyncReadSessionLocal() as db:
+        cached = principal_cache.get(token)
+        if cached is not None:
+            principal, version = cached
+            if await async_crud.get_auth_version(db, principal.id) == version:
+                return principal
+        payload = decode_access_token(token)
+        user_id = payload.get("uid")
+        if user_id is None:
+            return remember_principal(token, payload, await async_crud.get_user_by_email(db, email=payload["sub"]), None)
+        version = await async_crud.get_auth_version(db, user_id)
+        return remember_principal(token, payload, await db.get(models.User, user_id), version)
+
+async def get_read_db(request: Request, current_user: schemas.User = Depends(get_current_user)):
+    db = await read_session(database.is_pinned(request.cookies, request.headers))
+    try:
+        yield db
+    except DBAPIError:
+        if "replica" in db.info:
+            replica_router.mark_unhealthy(db.info["replica"])
+        raise
+    finally:
+        await db.close()
+
+async def data_etag(request: Request, response: Response, current_user: schemas.User = Depends(get_current_user), db: AsyncSession = Depends(get_read_db)):
+    apply_data_etag(request, response, current_user.id, await async_crud.get_data_version(db, current_user.id))
+
+
+# --- АУТЕНТИФИКАЦИЯ (ТІРКЕЛУ/КІРУ) ---
+@app.post("/users/", response_model=schemas.User)
+async def register(user: schemas.UserCreate, db: AsyncSession = Depends(get_db)):
+    async with AsyncReadSessionLocal() as read_db:
+        existing = await async_crud.get_user_by_email(read_db, email=user.email)
+    if existing:
+        raise HTTPException(status_code=400, detail="Бұл email тіркелген!")
+    return await async_crud.create_user(db, user)
+
+@app.post("/token")
+async def login(form_data: OAuth2PasswordRequestForm = Depends(), db: AsyncSession = Depends(get_db)):
+    async with AsyncReadSessionLocal() as read_db:
+        user = await async_crud.get_user_by_email(read_db, email=form_data.username)
+    if not user or not user.is_active:
+        raise HTTPException(status_code=401, detail="Қате email немесе құпия сөз")
+    verified, new_hash = await utils.verify_and_update_password_async(form_data.password, user.hashed_password)
+    if not verified:
+        raise HTTPException(status_code=401, detail="Қате email немесе құпия сөз")
+    if new_hash:
+        await async_crud.update_user_password_hash(db, user.id, new_hash)
+    access_token = create_access_token(data={"sub": user.email, "uid": user.id})
+    return {"access_token": access_token, "token_type": "bearer"}
+
+@app.get("/users/me/", response_model=schemas.User)
+async def read_users_me(current_user: schemas.User = Depends(get_current_user)):
+    return current_user
+
+
+# --- КАТЕГОРИЯЛАР (Басқару) ---
+@app.post("/categories/", response_model=schemas.CategoryResponse)
+async def add_category(category: schemas.CategoryCreate, db: AsyncSession = Depends(get_db), current_user: schemas.User = Depends(get_current_user)):
+    return await async_crud.create_user_category(db, category, current_user.id)
+
+@app.get("/categories/", response_model=List[schemas.CategoryResponse], dependencies=[Depends(data_etag)])
+async def get_categories(response: Response, db: AsyncSession = Depends(get_read_db), current_user: schemas.User = Depends(get_current_user)):
+    if main.FAST_LIST_SERIALIZATION:
+        return json_bytes_response(main.encode_categories(await async_crud.get_user_category_rows(db, current_user.id)), response)
+    return await async_crud.get_user_categories(db, current_user.id)
+
+
+# --- ШЫҒЫНДАР (EXPENSES) ---
+@app.post("/expenses/", response_model=schemas.ExpenseCreateResponse)
+async def add_expense(expense: schemas.ExpenseCreate, db: AsyncSession = Depends(get_db), current_user: schemas.User = Depends(get_current_user)):
+    return await async_crud.create_user_expense(db, expense, current_user.id)
+
+@app.post("/expenses/bulk", response_model=schemas.BulkInsertResult)
+async def add_expenses_bulk(rows: list = Depends(read_bulk_rows), db: AsyncSession = Depends(get_db), current_user: schemas.User = Depends(get_current_user)):
+    return await async_crud.bulk_create_user_expenses(db, rows, current_user.id)
+
+@app.get("/expenses/", response_model=List[schemas.ExpenseResponse], dependencies=[Depends(data_etag)])
+async def get_expenses(response: Response, filters: dict = Depends(ledger_filters), db: AsyncSession = Depends(get_read_db), current_user: schemas.User = Depends(get_current_user)):
+    page = async_crud.get_user_expense_rows_page if main.FAST_LIST_SERIALIZATION else async_crud.get_user_expenses_page
+    try:
+        items, next_cursor = await page(db, current_user.id, **filters)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Қате курсор")
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
+    if main.FAST_LIST_SERIALIZATION:
+        return json_bytes_response(main.encode_expenses(items), response)
+    return items
+
+@app.post("/expenses/batch-update", response_model=schemas.BatchResult)
+async def batch_update_expenses(body: schemas.ExpenseBatchUpdate, db: AsyncSession = Depends(get_db), current_user: schemas.User = Depends(get_current_user)):
+    try:
+        return {"affected": await async_crud.update_user_expenses(db, current_user.id, body.changes, **batch_selection(body))}
+    except ValueError:
+        raise HTTPException(status_code=400, detail="ids, category_id немесе күн аралығы көрсетілуі керек")
+    except LookupError:
+        raise HTTPException(status_code=404, detail="Санат табылмады")
+
+@app.post("/expenses/batch-delete", response_model=schemas.BatchResult)
+async def batch_delete_expenses(body: schemas.ExpenseSelection, db: AsyncSession = Depends(get_db), current_user: schemas.User = Depends(get_current_user)):
+    try:
+        return {"affected": await async_crud.delete_user_expenses(db, current_user.id, **batch_selection(body))}
+    except ValueError:
+        raise HTTPException(status_code=400, detail="ids, category_id немесе күн аралығы көрсетілуі керек")
+
+@app.patch("/expenses/{expense_id}", response_model=schemas.ExpenseResponse)
+async def update_expense(expense_id: int, changes: schemas.ExpenseUpdate, db: AsyncSession = Depends(get_db), current_user: schemas.User = Depends(get_current_user)):
+    try:
+        expense = await async_crud.update_user_expense(db, expense_id, current_user.id, changes)
+    except LookupError:
+        raise HTTPException(status_code=404, detail="Санат табылмады")
+    if expense is None:
+        raise HTTPException(status_code=404, detail="Шығын табылмады")
+    return expense
+
+@app.delete("/expenses/{expense_id}")
+async def delete_expense(expense_id: int, db: AsyncSession = Depends(get_db), current_user: schemas.User = Depends(get_current_user)):
+    await async_crud.delete_user_expense(db, expense_id, current_user.id)
+    return {"message": "Сәтті өшірілді"}
+
+
+# --- КІРІСТЕР (INCOMES) ---
+@app.post("/incomes/", response_model=schemas.IncomeResponse)
+async def add_income(income: schemas.IncomeCreate, db: AsyncSession = Depends(get_db), current_user: schemas.User = Depends(get_current_user)):
+    return await async_crud.create_user_income(db, income, current_user.id)
+
+@app.post("/incomes/bulk", response_model=schemas.BulkInsertResult)
+async def add_incomes_bulk(rows: list = Depends(read_bulk_rows), db: AsyncSession = Depends(get_db), current_user: schemas.User = Depends(get_current_user)):
+    return await async_crud.bulk_create_user_incomes(db, rows, current_user.id)
+
+@app.get("/incomes/", response_model=List[schemas.IncomeResponse], dependencies=[Depends(data_etag)])
+async def get_incomes(response: Response, filters: dict = Depends(ledger_filters), db: AsyncSession = Depends(get_read_db), current_user: schemas.User = Depends(get_current_user)):
+    page = async_crud.get_user_income_rows_page if main.FAST_LIST_SERIALIZATION else async_crud.get_user_incomes_page
+    try:
+        items, next_cursor = await page(db, current_user.id, **filters)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Қате курсор")
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
+    if main.FAST_LIST_SERIALIZATION:
+        return json_bytes_response(main.encode_incomes(items), response)
+    return items
+
+
+# --- БАЛАНС ЖӘНЕ СТАТИСТИКА ---
+@app.get("/balance/", response_model=schemas.BalanceResponse, dependencies=[Depends(data_etag)])
+async def get_balance(db: AsyncSession = Depends(get_read_db), current_user: schemas.User = Depends(get_current_user)):
+    return await async_crud.get_user_balance(db, current_user.id)
+
+@app.get("/statistics/expenses/", response_model=List[schemas.CategoryStats], dependencies=[Depends(data_etag)])
+async def get_stats(db: AsyncSession = Depends(get_read_db), current_user: schemas.User = Depends(get_current_user)):
+    return await async_crud.get_expenses_by_category(db, current_user.id)
+
+@app.get("/statistics/timeseries/", response_model=List[schemas.TimeseriesPoint], dependencies=[Depends(data_etag)])
+async def get_timeseries(
+    bucket: str = Query("month", pattern="^(day|week|month)$"),
+    date_from: Optional[date] = None,
+    date_to: Optional[date] = None,
+    by_category: bool = False,
+    db: AsyncSession = Depends(get_read_db),
+    current_user: schemas.User = Depends(get_current_user)
+):
+    return await async_crud.get_timeseries(db, current_user.id, bucket=bucket, date_from=date_from, date_to=date_to, by_category=by_category)
+
+
+# --- ІЗДЕУ ---
+@app.get("/search/", response_model=List[schemas.SearchResult], dependencies=[Depends(data_etag)])
+async def search_ledger(
+    q: str = Query(..., min_length=1, max_length=200),
+    type: Optional[str] = Query(None, pattern="^(expense|income)$"),
+    amount_min: Optional[float] = None,
+    amount_max: Optional[float] = None,
+    date_from: Optional[date] = None,
+    date_to: Optional[date] = None,
+    category_id: Optional[int] = None,
+    limit: int = Query(50, ge=1, le=200),
+    db: AsyncSession = Depends(get_read_db),
+    current_user: schemas.User = Depends(get_current_user)
+):
+    return await async_crud.search_user_ledger(db, current_user.id, q, kind=type, amount_min=amount_min, amount_max=amount_max,
+                                               date_from=date_from, date_to=date_to, category_id=category_id, limit=limit)
+
+
+# --- ЭКСПОРТ (CSV / NDJSON) ---
+async def _stream_ledger(user_id: int, export_format: str):
+    # run_sync генераторды қайтара алмайды: сол сұраныстарды серверлік курсормен ағынмен оқимыз
+    async with AsyncReadSessionLocal() as db:
+        yield main.export_header(export_format)
+        for stmt in crud.user_ledger_export_statements(user_id):
+            result = await db.stream(stmt)
+            async for rows in result.partitions(main.EXPORT_FLUSH_ROWS):
+                yield main.encode_export_rows(rows, export_format)
+
+@app.get("/export/")
+async def export_ledger(format: str = Query("csv", pattern="^(csv|ndjson)$"), current_user: schemas.User = Depends(get_current_user)):
+    media_type = "text/csv" if format == "csv" else "application/x-ndjson"
+    return StreamingResponse(
+        _stream_ledger(current_user.id, format),
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="ledger.{format}"'},
+    )
+
+
+# --- БЮДЖЕТ API ---
+@app.post("/budgets/", response_model=schemas.BudgetResponse)
+async def create_budget(budget: schemas.BudgetCreate, db: AsyncSession = Depends(get_db), current_user: schemas.User = Depends(get_current_user)):
+    return await async_crud.create_budget(db, budget=budget, user_id=current_user.id)
+
+@app.get("/budgets/", response_model=List[schemas.BudgetResponse], dependencies=[Depends(data_etag)])
+async def read_budgets(response: Response, db: AsyncSession = Depends(get_read_db), current_user: schemas.User = Depends(get_current_user)):
+    if main.FAST_LIST_SERIALIZATION:
+        return json_bytes_response(main.encode_budgets(await async_crud.get_user_budget_rows(db, user_id=current_user.id)), response)
+    return await async_crud.get_user_budgets(db, user_id=current_user.id)
+
+@app.get("/budgets/status/", response_model=List[schemas.BudgetStatus], dependencies=[Depends(data_etag)])
+async def read_budget_statuses(db: AsyncSession = Depends(get_read_db), current_user: schemas.User = Depends(get_current_user)):
+    return await async_crud.get_user_budget_statuses(db, user_id=current_user.id)
+
+
+# Қалған маршруттар (профиль, құпия сөз, Telegram, аккаунтты өшіру) sync қосымшада
+app.mount("/", main.app)
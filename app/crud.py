@@ -1,29 +1,57 @@
 from sqlalchemy.orm import Session
-from sqlalchemy import func
-from . import models, schemas
+from sqlalchemy import func, tuple_, select, literal, insert, update, delete, union_all, null, cast, String, and_
+from sqlalchemy import literal_column, table, true
+from sqlalchemy.dialects import postgresql, sqlite
+from pydantic import ValidationError
+from . import models, schemas, database
+from .serializers import response_fields
+from .search import tsvector_sql, user_token, TS_CONFIG
 from .utils import get_password_hash
-from datetime import datetime
+from datetime import datetime, date, time, timedelta
+import base64
+import binascii
+import io
+import re
 
 # USER
 def get_user_by_email(db: Session, email: str):
     return db.query(models.User).filter(models.User.email == email).first()
-def create_user(db: Session, user: schemas.UserCreate):
-    hashed_password = get_password_hash(user.password)
+def create_user(db: Session, user: schemas.UserCreate, hashed_password: str = None):
+    # hashed_password lets callers hash off the request thread/event loop
+    if hashed_password is None:
+        hashed_password = get_password_hash(user.password)
     db_user = models.User(email=user.email, username=user.username, hashed_password=hashed_password)
     db.add(db_user)
+    db.flush()
+    db.add(models.UserBalance(user_id=db_user.id, total_income=0, total_expenses=0))
     db.commit()
     db.refresh(db_user)
     return db_user
+def update_user_password_hash(db: Session, user_id: int, hashed_password: str):
+    db.execute(update(models.User).where(models.User.id == user_id).values(hashed_password=hashed_password))
+    bump_auth_version(db, user_id)
+    db.commit()
+# Separate from the data version so ledger writes don't evict cached principals.
+# Only profile/password changes and account deletion bump it.
+def bump_auth_version(db: Session, user_id: int):
+    stmt = _dialect_insert(db, models.UserAuthVersion).values(user_id=user_id, version=1)
+    db.execute(stmt.on_conflict_do_update(
+        index_elements=["user_id"], set_={"version": models.UserAuthVersion.version + 1}))
+def get_auth_version(db: Session, user_id: int) -> int:
+    return db.scalar(select(models.UserAuthVersion.version).where(models.UserAuthVersion.user_id == user_id)) or 0
 
 # CATEGORY
 def create_user_category(db: Session, category: schemas.CategoryCreate, user_id: int):
     db_category = models.Category(name=category.name, user_id=user_id)
     db.add(db_category)
+    bump_data_version(db, user_id)
     db.commit()
     db.refresh(db_category)
     return db_category
 def get_user_categories(db: Session, user_id: int):
     return db.query(models.Category).filter(models.Category.user_id == user_id).all()
+def get_user_category_rows(db: Session, user_id: int):
+    return db.query(*_row_columns(models.Category, schemas.CategoryResponse)).filter(models.Category.user_id == user_id).all()
 
 # EXPENSE
 def create_user_expense(db: Session, expense: schemas.ExpenseCreate, user_id: int):
@@ -34,18 +62,84 @@ def create_user_expense(db: Session, expense: schemas.ExpenseCreate, user_id: in
         date=expense.date, 
         user_id=user_id
     )
+    alerts = _crossed_budget_thresholds(db, user_id, expense)
     db.add(db_expense)
+    if alerts:
+        _enqueue_budget_alerts(db, user_id, db_expense, alerts)
+    _apply_rollup(db, models.Expense, user_id, [(expense.amount, expense.category_id, expense.date)])
+    bump_data_version(db, user_id)
     db.commit()
     db.refresh(db_expense)
+    db_expense.budget_alerts = alerts
     return db_expense
-def get_user_expenses(db: Session, user_id: int):
-    return db.query(models.Expense).filter(models.Expense.user_id == user_id).all()
+def get_user_expenses_page(db: Session, user_id: int, **filters):
+    return _get_ledger_page(db, models.Expense, user_id, **filters)
+def get_user_expense_rows_page(db: Session, user_id: int, **filters):
+    return _get_ledger_page(db, models.Expense, user_id, columns=_row_columns(models.Expense, schemas.ExpenseResponse), **filters)
 def delete_user_expense(db: Session, expense_id: int, user_id: int):
     expense = db.query(models.Expense).filter(models.Expense.id == expense_id, models.Expense.user_id == user_id).first()
     if expense:
+        _apply_rollup(db, models.Expense, user_id, [(expense.amount, expense.category_id, expense.date)], sign=-1)
         db.delete(expense)
+        bump_data_version(db, user_id)
         db.commit()
     return expense
+def _expense_selection(user_id: int, ids: list = None, category_id: int = None, date_from: date = None, date_to: date = None):
+    if ids is None and category_id is None and date_from is None and date_to is None:
+        raise ValueError("empty selection")
+    clauses = [models.Expense.user_id == user_id, *_date_range(models.Expense, date_from, date_to)]
+    if ids is not None:
+        clauses.append(models.Expense.id.in_(ids))
+    if category_id is not None:
+        clauses.append(models.Expense.category_id == category_id)
+    return clauses
+def update_user_expenses(db: Session, user_id: int, changes: schemas.ExpenseUpdate, **selection) -> int:
+    # The rollups need each row's old values, read under the same lock as the
+    # UPDATE so a concurrent batch can't move the rows in between
+    values = changes.model_dump(exclude_unset=True)
+    clauses = _expense_selection(user_id, **selection)
+    if not values:
+        return db.scalar(select(func.count()).select_from(models.Expense).where(*clauses))
+    if values.get("category_id") is not None and db.scalar(select(models.Category.id).where(
+            models.Category.id == values["category_id"], models.Category.user_id == user_id)) is None:
+        raise LookupError("category not found")
+    if db.get_bind().dialect.name == "postgresql":
+        # One statement: rows are locked by the CTE and only those rows are
+        # updated, so a row committed meanwhile can't slip into the UPDATE
+        old = (select(models.Expense.id, models.Expense.amount, models.Expense.category_id, models.Expense.date)
+               .where(*clauses).with_for_update().cte("old"))
+        old_rows = db.execute(update(models.Expense).where(models.Expense.id == old.c.id).values(**values)
+                              .returning(old.c.amount, old.c.category_id, old.c.date)).all()
+    else:
+        # SQLite: the transaction began with BEGIN IMMEDIATE, so the writer lock
+        # is already held for both statements
+        old_rows = db.execute(select(models.Expense.amount, models.Expense.category_id, models.Expense.date)
+                              .where(*clauses)).all()
+        if old_rows:
+            db.execute(update(models.Expense).where(*clauses).values(**values))
+    if not old_rows:
+        db.rollback()
+        return 0
+    new_rows = [(values.get("amount", amount), values.get("category_id", category_id), values.get("date", row_date))
+                for amount, category_id, row_date in old_rows]
+    _apply_rollup(db, models.Expense, user_id, old_rows, sign=-1)
+    _apply_rollup(db, models.Expense, user_id, new_rows)
+    bump_data_version(db, user_id)
+    db.commit()
+    return len(old_rows)
+def update_user_expense(db: Session, expense_id: int, user_id: int, changes: schemas.ExpenseUpdate):
+    if not update_user_expenses(db, user_id, changes, ids=[expense_id]):
+        return None
+    return db.get(models.Expense, expense_id, populate_existing=True)
+def delete_user_expenses(db: Session, user_id: int, **selection) -> int:
+    clauses = _expense_selection(user_id, **selection)
+    deleted = db.execute(delete(models.Expense).where(*clauses)
+                         .returning(models.Expense.amount, models.Expense.category_id, models.Expense.date)).all()
+    if deleted:
+        _apply_rollup(db, models.Expense, user_id, deleted, sign=-1)
+        bump_data_version(db, user_id)
+    db.commit()
+    return len(deleted)
 
 # INCOME
 def create_user_income(db: Session, income: schemas.IncomeCreate, user_id: int):
@@ -57,20 +151,328 @@ def create_user_income(db: Session, income: schemas.IncomeCreate, user_id: int):
         user_id=user_id
     )
     db.add(db_income)
+    _apply_rollup(db, models.Income, user_id, [(income.amount, income.category_id, income.date)])
+    bump_data_version(db, user_id)
     db.commit()
     db.refresh(db_income)
     return db_income
-def get_user_incomes(db: Session, user_id: int):
-    return db.query(models.Income).filter(models.Income.user_id == user_id).all()
+def get_user_incomes_page(db: Session, user_id: int, **filters):
+    return _get_ledger_page(db, models.Income, user_id, **filters)
+def get_user_income_rows_page(db: Session, user_id: int, **filters):
+    return _get_ledger_page(db, models.Income, user_id, columns=_row_columns(models.Income, schemas.IncomeResponse), **filters)
 
-# BALANCE & STATS
-def get_user_balance(db: Session, user_id: int):
+# BULK
+LEDGER_INSERT_COLUMNS = ["amount", "description", "category_id", "date", "user_id"]
+def bulk_create_user_expenses(db: Session, rows: list, user_id: int):
+    return _bulk_create_ledger(db, models.Expense, schemas.ExpenseCreate, rows, user_id)
+def bulk_create_user_incomes(db: Session, rows: list, user_id: int):
+    return _bulk_create_ledger(db, models.Income, schemas.IncomeCreate, rows, user_id)
+def _bulk_create_ledger(db: Session, model, schema, rows: list, user_id: int):
+    errors, valid = [], []
+    for index, row in enumerate(rows):
+        try:
+            valid.append((index, schema.model_validate(row)))
+        except ValidationError as e:
+            for err in e.errors():
+                errors.append({"row": index, "field": ".".join(str(loc) for loc in err["loc"]), "message": err["msg"]})
+    # Category ownership is checked once for the whole batch
+    category_ids = {item.category_id for _, item in valid if item.category_id is not None}
+    owned = set()
+    if category_ids:
+        owned = set(db.scalars(select(models.Category.id).where(
+            models.Category.user_id == user_id, models.Category.id.in_(category_ids))))
+    values = []
+    for index, item in valid:
+        if item.category_id is not None and item.category_id not in owned:
+            errors.append({"row": index, "field": "category_id", "message": "Category not found"})
+            continue
+        values.append({"amount": item.amount, "description": item.description,
+                       "category_id": item.category_id, "date": item.date, "user_id": user_id})
+    inserted_ids = []
+    if values:
+        _apply_rollup(db, model, user_id, [(row["amount"], row["category_id"], row["date"]) for row in values])
+        if db.get_bind().dialect.driver == "psycopg2":
+            inserted_ids = _copy_insert_ledger(db, model, values)
+        else:
+            stmt = insert(model).returning(model.id, sort_by_parameter_order=True)
+            inserted_ids = list(db.scalars(stmt, values))
+        bump_data_version(db, user_id)
+        db.commit()
+    errors.sort(key=lambda err: err["row"])
+    return {"inserted_ids": inserted_ids, "errors": errors}
+def _copy_value(value):
+    if value is None:
+        return "\\N"
+    if isinstance(value, date):
+        return value.isoformat()
+    return str(value).replace("\\", "\\\\").replace("\t", "\\t").replace("\n", "\\n").replace("\r", "\\r")
+def _copy_insert_ledger(db: Session, model, values: list):
+    # PostgreSQL (psycopg2): COPY into a temp table, then one INSERT ... SELECT ... RETURNING
+    table = model.__tablename__
+    columns = ", ".join(LEDGER_INSERT_COLUMNS)
+    buffer = io.StringIO()
+    for row in values:
+        buffer.write("\t".join(_copy_value(row[col]) for col in LEDGER_INSERT_COLUMNS) + "\n")
+    buffer.seek(0)
+    cursor = db.connection().connection.cursor()
+    try:
+        cursor.execute(f"CREATE TEMP TABLE bulk_{table} ON COMMIT DROP AS SELECT {columns} FROM {table} WITH NO DATA")
+        cursor.copy_expert(f"COPY bulk_{table} ({columns}) FROM STDIN", buffer)
+        cursor.execute(f"INSERT INTO {table} ({columns}) SELECT {columns} FROM bulk_{table} RETURNING id")
+        return sorted(row[0] for row in cursor.fetchall())
+    finally:
+        cursor.close()
+
+# ROW QUERIES
+# Column-only selects in response-schema field order, for serializers.make_list_encoder
+def _row_columns(model, schema):
+    return [getattr(model, name) for name in response_fields(schema)]
+
+# PAGINATION
+# Keyset pagination over (date, id), newest first. Served by the
+# (user_id, date, id) indexes on expenses/incomes as an index range scan.
+def encode_cursor(row_date: datetime, row_id: int) -> str:
+    raw = f"{row_date.isoformat()}|{row_id}".encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+def decode_cursor(cursor: str):
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+        row_date, row_id = raw.rsplit("|", 1)
+        return datetime.fromisoformat(row_date), int(row_id)
+    except (ValueError, binascii.Error, UnicodeDecodeError):
+        raise ValueError("Invalid cursor")
+def _date_range(model, date_from: date = None, date_to: date = None):
+    # Inclusive calendar-day bounds on a DateTime column, kept sargable
+    clauses = []
+    if date_from:
+        clauses.append(model.date >= datetime.combine(date_from, time.min))
+    if date_to:
+        clauses.append(model.date < datetime.combine(date_to + timedelta(days=1), time.min))
+    return clauses
+def _get_ledger_page(db: Session, model, user_id: int, limit: int = 100, after: str = None,
+                     date_from: date = None, date_to: date = None, category_id: int = None, columns=None):
+    query = db.query(*(columns or [model])).filter(model.user_id == user_id, *_date_range(model, date_from, date_to))
+    if category_id is not None:
+        query = query.filter(model.category_id == category_id)
+    if after:
+        after_date, after_id = decode_cursor(after)
+        query = query.filter(tuple_(model.date, model.id) < tuple_(after_date, after_id))
+    rows = query.order_by(model.date.desc(), model.id.desc()).limit(limit + 1).all()
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(rows[-1].date, rows[-1].id)
+    return rows, next_cursor
+
+# EXPORT
+LEDGER_EXPORT_COLUMNS = ["type", "id", "date", "amount", "category_id", "category_name", "description"]
+def user_ledger_export_statements(user_id: int, chunk_size: int = 1000):
+    # Server-side cursor: rows are fetched chunk_size at a time, never as one list.
+    # Shared with the async export, which streams them through AsyncSession.stream
+    return [
+        select(literal(kind), model.id, model.date, model.amount, model.category_id,
+               models.Category.name, model.description)
+        .outerjoin(models.Category, models.Category.id == model.category_id)
+        .where(model.user_id == user_id)
+        .order_by(model.date, model.id)
+        .execution_options(yield_per=chunk_size)
+        for kind, model in (("expense", models.Expense), ("income", models.Income))
+    ]
+def iter_user_ledger(db: Session, user_id: int, chunk_size: int = 1000):
+    for stmt in user_ledger_export_statements(user_id, chunk_size):
+        yield from db.execute(stmt)
+
+# SEARCH
+# Ranked prefix matching on descriptions, served by the indexes from search.py.
+# Only \w+ tokens from the user's query reach the MATCH/tsquery syntax.
+SEARCH_MAX_TERMS = 16
+def _search_terms(q: str):
+    return re.findall(r"\w+", q.lower())[:SEARCH_MAX_TERMS]
+def _search_clause(db: Session, model, user_id: int, terms):
+    name = model.__tablename__
+    if db.get_bind().dialect.name == "sqlite":
+        # Materialized so the FTS hits drive the join instead of being re-probed per user row.
+        # The user token narrows the match to this user's rows; weight 0 keeps it out of the rank
+        fts = literal_column(f"{name}_fts")
+        prefixes = " ".join(f'"{term}"*' for term in terms)
+        query = f"user_tok : {user_token(user_id)} AND description : ({prefixes})"
+        hits = (
+            select(literal_column("rowid").label("id"), func.bm25(fts, 1.0, 0.0).label("rank"))
+            .select_from(table(f"{name}_fts"))
+            .where(fts.op("MATCH")(query))
+            .cte(f"{name}_hits").prefix_with("MATERIALIZED")
+        )
+        return hits.join(model, model.id == hits.c.id), true(), -hits.c.rank
+    vector = literal_column(tsvector_sql(name))
+    query = func.to_tsquery(literal_column(f"'{TS_CONFIG}'"), " & ".join(f"{term}:*" for term in terms))
+    return model, vector.op("@@")(query), func.ts_rank(vector, query)
+def search_user_ledger(db: Session, user_id: int, q: str, kind: str = None, amount_min: float = None,
+                       amount_max: float = None, date_from: date = None, date_to: date = None,
+                       category_id: int = None, limit: int = 50):
+    terms = _search_terms(q)
+    if not terms:
+        return []
+    results = []
+    for kind_name, model in (("expense", models.Expense), ("income", models.Income)):
+        if kind and kind != kind_name:
+            continue
+        source, match, score = _search_clause(db, model, user_id, terms)
+        stmt = (
+            select(literal(kind_name).label("type"), model.id, model.date, model.amount, model.category_id,
+                   models.Category.name.label("category_name"), model.description, score.label("rank"))
+            .select_from(source)
+            .outerjoin(models.Category, models.Category.id == model.category_id)
+            .where(match, model.user_id == user_id, *_date_range(model, date_from, date_to))
+            .order_by(score.desc(), model.id.desc())
+            .limit(limit)
+        )
+        if amount_min is not None:
+            stmt = stmt.where(model.amount >= amount_min)
+        if amount_max is not None:
+            stmt = stmt.where(model.amount <= amount_max)
+        if category_id is not None:
+            stmt = stmt.where(model.category_id == category_id)
+        results.extend(db.execute(stmt).mappings().all())
+    results.sort(key=lambda row: row["rank"], reverse=True)
+    return results[:limit]
+
+# ROLLUPS
+# Running totals per user and per (user, category, month), written in the
+# same transaction as every ledger insert/delete. The balance row is created
+# with the user; accounts older than the rollup tables are backfilled once at
+# startup (backfill_missing_rollups), never lazily on a request.
+def _dialect_insert(db: Session, model):
+    if db.get_bind().dialect.name == "postgresql":
+        return postgresql.insert(model)
+    return sqlite.insert(model)
+def _month_key(db: Session, column):
+    if db.get_bind().dialect.name == "postgresql":
+        return func.to_char(column, "YYYY-MM")
+    return func.strftime("%Y-%m", column)
+def _date_bucket(db: Session, column, bucket: str):
+    # Bucket start as a 'YYYY-MM-DD' string; weeks start on Monday
+    if db.get_bind().dialect.name == "postgresql":
+        return func.to_char(func.date_trunc(bucket, column), "YYYY-MM-DD")
+    if bucket == "week":
+        return func.date(column, "weekday 0", "-6 days")
+    if bucket == "month":
+        return func.strftime("%Y-%m-01", column)
+    return func.date(column)
+def _month_of(value) -> str:
+    return f"{value.year:04d}-{value.month:02d}"
+def _apply_rollup(db: Session, model, user_id: int, rows, sign: int = 1):
+    # rows: (amount, category_id, date) tuples; sign=-1 when removing them
+    total = 0.0
+    buckets = {}
+    for amount, category_id, row_date in rows:
+        total += amount
+        if model is models.Expense and category_id is not None:
+            key = (category_id, _month_of(row_date))
+            bucket_amount, bucket_count = buckets.get(key, (0.0, 0))
+            buckets[key] = (bucket_amount + amount, bucket_count + 1)
+    column = models.UserBalance.total_expenses if model is models.Expense else models.UserBalance.total_income
+    db.execute(update(models.UserBalance).where(models.UserBalance.user_id == user_id).values({column: column + sign * total}))
+    for (category_id, month), (amount, count) in buckets.items():
+        stmt = _dialect_insert(db, models.CategoryMonthlyTotal).values(
+            user_id=user_id, category_id=category_id, month=month,
+            total_amount=sign * amount, expense_count=sign * count)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=["user_id", "category_id", "month"],
+            set_={"total_amount": models.CategoryMonthlyTotal.total_amount + stmt.excluded.total_amount,
+                  "expense_count": models.CategoryMonthlyTotal.expense_count + stmt.excluded.expense_count})
+        db.execute(stmt)
+def _compute_rollups(db: Session, user_id: int):
     total_income = db.query(func.sum(models.Income.amount)).filter(models.Income.user_id == user_id).scalar() or 0
     total_expenses = db.query(func.sum(models.Expense.amount)).filter(models.Expense.user_id == user_id).scalar() or 0
+    month = _month_key(db, models.Expense.date)
+    monthly = db.query(models.Expense.category_id, month, func.sum(models.Expense.amount), func.count(models.Expense.id)).filter(
+        models.Expense.user_id == user_id, models.Expense.category_id.isnot(None)).group_by(models.Expense.category_id, month).all()
+    return total_income, total_expenses, {(category_id, key): (amount, count) for category_id, key, amount, count in monthly}
+def rebuild_user_rollups(db: Session, user_id: int):
+    total_income, total_expenses, monthly = _compute_rollups(db, user_id)
+    delete_user_rollups(db, user_id)
+    db.execute(insert(models.UserBalance).values(user_id=user_id, total_income=total_income, total_expenses=total_expenses))
+    if monthly:
+        db.execute(insert(models.CategoryMonthlyTotal), [
+            {"user_id": user_id, "category_id": category_id, "month": month, "total_amount": amount, "expense_count": count}
+            for (category_id, month), (amount, count) in monthly.items()])
+def backfill_missing_rollups(db: Session) -> int:
+    # ON CONFLICT DO NOTHING: several workers may run this at startup at once
+    missing = db.scalars(select(models.User.id).where(~select(models.UserBalance.user_id).where(
+        models.UserBalance.user_id == models.User.id).exists())).all()
+    for user_id in missing:
+        total_income, total_expenses, monthly = _compute_rollups(db, user_id)
+        stmt = _dialect_insert(db, models.UserBalance).values(user_id=user_id, total_income=total_income, total_expenses=total_expenses)
+        if db.execute(stmt.on_conflict_do_nothing(index_elements=["user_id"])).rowcount and monthly:
+            db.execute(insert(models.CategoryMonthlyTotal), [
+                {"user_id": user_id, "category_id": category_id, "month": month, "total_amount": amount, "expense_count": count}
+                for (category_id, month), (amount, count) in monthly.items()])
+        db.commit()
+    return len(missing)
+def check_user_rollups(db: Session, user_id: int, tolerance: float = 1e-6):
+    total_income, total_expenses, monthly = _compute_rollups(db, user_id)
+    drift = []
+    balance = db.execute(select(models.UserBalance.total_income, models.UserBalance.total_expenses).where(
+        models.UserBalance.user_id == user_id)).first()
+    if balance is None:
+        return ["balance row missing"]
+    if abs(balance.total_income - total_income) > tolerance:
+        drift.append(f"total_income: stored {balance.total_income}, actual {total_income}")
+    if abs(balance.total_expenses - total_expenses) > tolerance:
+        drift.append(f"total_expenses: stored {balance.total_expenses}, actual {total_expenses}")
+    stored = {(row.category_id, row.month): (row.total_amount, row.expense_count) for row in db.query(models.CategoryMonthlyTotal).filter(
+        models.CategoryMonthlyTotal.user_id == user_id, models.CategoryMonthlyTotal.expense_count != 0)}
+    for key in set(stored) | set(monthly):
+        stored_amount, stored_count = stored.get(key, (0, 0))
+        amount, count = monthly.get(key, (0, 0))
+        if stored_count != count or abs(stored_amount - amount) > tolerance:
+            drift.append(f"category {key[0]} {key[1]}: stored {stored_amount} ({stored_count}), actual {amount} ({count})")
+    return drift
+def delete_user_rollups(db: Session, user_id: int):
+    db.execute(delete(models.CategoryMonthlyTotal).where(models.CategoryMonthlyTotal.user_id == user_id))
+    db.execute(delete(models.UserBalance).where(models.UserBalance.user_id == user_id))
+
+# DATA VERSION
+# Monotonic per-user counter bumped inside every ledger/category/budget write;
+# read endpoints derive their ETag from it.
+def bump_data_version(db: Session, user_id: int):
+    database.note_write()
+    stmt = _dialect_insert(db, models.UserDataVersion).values(user_id=user_id, version=1)
+    db.execute(stmt.on_conflict_do_update(
+        index_elements=["user_id"], set_={"version": models.UserDataVersion.version + 1}))
+def get_data_version(db: Session, user_id: int) -> int:
+    return db.scalar(select(models.UserDataVersion.version).where(models.UserDataVersion.user_id == user_id)) or 0
+
+# BALANCE & STATS
+def get_user_balance(db: Session, user_id: int):
+    # A replica may not have the signup row yet; that account has no data either
+    balance = db.execute(select(models.UserBalance.total_income, models.UserBalance.total_expenses).where(
+        models.UserBalance.user_id == user_id)).first()
+    total_income, total_expenses = balance or (0.0, 0.0)
     return {"total_income": total_income, "total_expenses": total_expenses, "net_balance": total_income - total_expenses}
 def get_expenses_by_category(db: Session, user_id: int):
-    results = db.query(models.Category.name, func.sum(models.Expense.amount)).join(models.Expense).filter(models.Expense.user_id == user_id).group_by(models.Category.name).all()
+    rollup = models.CategoryMonthlyTotal
+    results = db.query(models.Category.name, func.sum(rollup.total_amount)).join(rollup, rollup.category_id == models.Category.id).filter(
+        rollup.user_id == user_id).group_by(models.Category.name).having(func.sum(rollup.expense_count) > 0).all()
     return [{"category_name": name, "total_amount": amount} for name, amount in results]
+def get_timeseries(db: Session, user_id: int, bucket: str = "month", date_from: date = None, date_to: date = None, by_category: bool = False):
+    parts = []
+    for kind, model in (("expense", models.Expense), ("income", models.Income)):
+        period = _date_bucket(db, model.date, bucket)
+        category = models.Category.name if by_category else cast(null(), String)
+        stmt = (
+            select(period.label("period"), literal(kind).label("type"), category.label("category_name"),
+                   func.sum(model.amount).label("total_amount"))
+            .select_from(model)
+            .where(model.user_id == user_id, *_date_range(model, date_from, date_to))
+            .group_by(period)
+        )
+        if by_category:
+            stmt = stmt.outerjoin(models.Category, models.Category.id == model.category_id).group_by(models.Category.name)
+        parts.append(stmt)
+    combined = union_all(*parts).subquery()
+    results = db.execute(select(combined).order_by(combined.c.period, combined.c.type, combined.c.category_name)).all()
+    return [{"period": period, "type": kind, "category_name": name, "total_amount": amount} for period, kind, name, amount in results]
 
 # BUDGET
 def create_budget(db: Session, budget: schemas.BudgetCreate, user_id: int):
@@ -82,8 +484,70 @@ def create_budget(db: Session, budget: schemas.BudgetCreate, user_id: int):
         user_id=user_id
     )
     db.add(db_budget)
+    bump_data_version(db, user_id)
     db.commit()
     db.refresh(db_budget)
     return db_budget
 def get_user_budgets(db: Session, user_id: int):
-    return db.query(models.Budget).filter(models.Budget.user_id == user_id).all()
\ No newline at end of file
+    return db.query(models.Budget).filter(models.Budget.user_id == user_id).all()
+def get_user_budget_rows(db: Session, user_id: int):
+    return db.query(*_row_columns(models.Budget, schemas.BudgetResponse)).filter(models.Budget.user_id == user_id).all()
+def _budget_spent_query(db: Session, user_id: int):
+    # Range join: each budget picks up the expenses of its category inside its window
+    spent = func.coalesce(func.sum(models.Expense.amount), 0)
+    return db.query(models.Budget.id, models.Budget.category_id, models.Budget.limit_amount,
+                    models.Budget.start_date, models.Budget.end_date, spent.label("spent")).outerjoin(
+        models.Expense, and_(
+            models.Expense.user_id == models.Budget.user_id,
+            models.Expense.category_id == models.Budget.category_id,
+            models.Expense.date >= models.Budget.start_date,
+            models.Expense.date <= models.Budget.end_date,
+        )).filter(models.Budget.user_id == user_id).group_by(
+        models.Budget.id, models.Budget.category_id, models.Budget.limit_amount,
+        models.Budget.start_date, models.Budget.end_date)
+def get_user_budget_statuses(db: Session, user_id: int):
+    results = _budget_spent_query(db, user_id).order_by(models.Budget.id).all()
+    return [{
+        "id": row.id, "user_id": user_id, "category_id": row.category_id, "limit_amount": row.limit_amount,
+        "start_date": row.start_date, "end_date": row.end_date, "spent": row.spent,
+        "remaining": row.limit_amount - row.spent, "percent_used": round(row.spent / row.limit_amount * 100, 2),
+    } for row in results]
+
+BUDGET_ALERT_THRESHOLDS = (80, 100)
+def _crossed_budget_thresholds(db: Session, user_id: int, expense: schemas.ExpenseCreate):
+    # Only budgets whose category and window contain the new expense are checked;
+    # must run before the expense is added so "spent" is the pre-insert total.
+    # Bound as a datetime like _date_range: SQLite compares the stored text, and
+    # a bare date ('2024-01-01') sorts before '2024-01-01 00:00:00.000000'.
+    expense_at = datetime.combine(expense.date, time.min)
+    results = _budget_spent_query(db, user_id).filter(
+        models.Budget.category_id == expense.category_id,
+        models.Budget.start_date <= expense_at,
+        models.Budget.end_date >= expense_at,
+    ).all()
+    alerts = []
+    for row in results:
+        spent_after = row.spent + expense.amount
+        for threshold in BUDGET_ALERT_THRESHOLDS:
+            limit = row.limit_amount * threshold / 100
+            if row.spent < limit <= spent_after:
+                alerts.append({"budget_id": row.id, "category_id": row.category_id, "threshold": threshold,
+                               "limit_amount": row.limit_amount, "spent": spent_after})
+    return alerts
+
+# OUTBOX
+# Budget alerts are queued in the expense's own transaction and sent later by
+# notifications.OutboxDispatcher, so Telegram latency never hits the write path.
+def _enqueue_budget_alerts(db: Session, user_id: int, db_expense: models.Expense, alerts: list):
+    chat_id = db.scalar(select(models.User.telegram_chat_id).where(models.User.id == user_id))
+    if not chat_id:
+        return
+    db.flush()  # assigns db_expense.id for the idempotency keys
+    category_name = db.scalar(select(models.Category.name).where(models.Category.id == db_expense.category_id))
+    db.execute(insert(models.NotificationOutbox), [{
+        "user_id": user_id,
+        "chat_id": chat_id,
+        "text": f"⚠️ «{category_name}» бюджеті {alert['threshold']}%-ға жетті: "
+                f"{alert['spent']:.2f} / {alert['limit_amount']:.2f}",
+        "idempotency_key": f"budget:{alert['budget_id']}:{alert['threshold']}:{db_expense.id}",
+    } for alert in alerts])
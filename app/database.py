@@ -1,7 +1,14 @@
+import contextvars
+import math
 import os
-from sqlalchemy import create_engine
+import threading
+import time
+from sqlalchemy import create_engine, event
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.engine import make_url
 from sqlalchemy.orm import declarative_base
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import QueuePool
 
 SQLALCHEMY_DATABASE_URL = os.getenv("DATABASE_URL")
 
@@ -11,8 +18,270 @@ if not SQLALCHEMY_DATABASE_URL:
 if SQLALCHEMY_DATABASE_URL and SQLALCHEMY_DATABASE_URL.startswith("postgres://"):
     SQLALCHEMY_DATABASE_URL = SQLALCHEMY_DATABASE_URL.replace("postgres://", "postgresql://", 1)
 
-engine = create_engine(SQLALCHEMY_DATABASE_URL)
+# --- ПУЛ ЖӘНЕ ДРАЙВЕР БАПТАУЛАРЫ ---
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "1") == "1"
+DB_STATEMENT_TIMEOUT_MS = int(os.getenv("DB_STATEMENT_TIMEOUT_MS", "0"))
+SQLITE_SYNCHRONOUS = os.getenv("SQLITE_SYNCHRONOUS", "NORMAL")
+SQLITE_BUSY_TIMEOUT_MS = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000"))
+
+
+class TimedQueuePool(QueuePool):
+    """QueuePool that records how long checkouts wait for a free connection."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._wait_lock = threading.Lock()
+        self.wait_count = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+        self.timeouts = 0
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            return super()._do_get()
+        except Exception:
+            with self._wait_lock:
+                self.timeouts += 1
+            raise
+        finally:
+            waited = time.perf_counter() - started
+            with self._wait_lock:
+                self.wait_count += 1
+                self.wait_total += waited
+                self.wait_max = max(self.wait_max, waited)
+
+    def recreate(self):
+        # dispose()/recreate() жаңа пул жасайды; статистика сол күйінде қалсын
+        pool = super().recreate()
+        pool.wait_count, pool.wait_total, pool.wait_max, pool.timeouts = (
+            self.wait_count, self.wait_total, self.wait_max, self.timeouts)
+        return pool
+
+
+def _is_sqlite_memory(url) -> bool:
+    return url.get_backend_name() == "sqlite" and url.database in (None, "", ":memory:")
+
+def engine_options(database_url: str, is_async: bool = False) -> dict:
+    url = make_url(database_url)
+    if _is_sqlite_memory(url):
+        # :memory: базасы бір қосылыста ғана өмір сүреді, әдепкі пулды қалдырамыз
+        return {}
+    options = {
+        "pool_size": DB_POOL_SIZE,
+        "max_overflow": DB_MAX_OVERFLOW,
+        "pool_timeout": DB_POOL_TIMEOUT,
+        "pool_pre_ping": DB_POOL_PRE_PING,
+    }
+    if not is_async:
+        options["poolclass"] = TimedQueuePool
+    if url.get_backend_name() == "sqlite":
+        if not is_async:
+            options["connect_args"] = {"check_same_thread": False, "timeout": SQLITE_BUSY_TIMEOUT_MS / 1000}
+    else:
+        options["pool_recycle"] = DB_POOL_RECYCLE
+        if DB_STATEMENT_TIMEOUT_MS and url.get_backend_name() == "postgresql":
+            if url.get_driver_name() == "asyncpg":
+                options["connect_args"] = {"server_settings": {"statement_timeout": str(DB_STATEMENT_TIMEOUT_MS)}}
+            else:
+                options["connect_args"] = {"options": f"-c statement_timeout={DB_STATEMENT_TIMEOUT_MS}"}
+    return options
+
+def install_sqlite_pragmas(sync_engine):
+    # WAL: оқушылар жазушыны бөгемейді; busy_timeout: "database is locked" орнына күту.
+    # journal_mode бапталмайды: сұранымның оқу сессиясы транзакциясын жазу коммитіне дейін
+    # ашық ұстайды, ал DELETE/TRUNCATE режимінде коммит барлық оқушыларды күтіп, құлыпқа тіреледі
+    if sync_engine.dialect.name != "sqlite" or _is_sqlite_memory(sync_engine.url):
+        return
+
+    @event.listens_for(sync_engine, "connect")
+    def _set_sqlite_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        # aiosqlite-тің cursor.execute-і курсорды қайтармайды, сондықтан fetchone бөлек
+        cursor.execute("PRAGMA journal_mode=WAL")
+        journal_mode = cursor.fetchone()[0]
+        if journal_mode.lower() != "wal":
+            cursor.close()
+            raise RuntimeError(f"SQLite WAL режиміне ауыса алмады (journal_mode={journal_mode}); "
+                               "WAL-ды қолдамайтын файлдық жүйеде (мысалы, желілік диск) базаны ұстамаңыз")
+        cursor.execute(f"PRAGMA synchronous={SQLITE_SYNCHRONOUS}")
+        cursor.execute(f"PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT_MS}")
+        cursor.close()
+        # BEGIN-ді драйвер емес, төмендегі "begin" оқиғасы жібереді
+        dbapi_connection.isolation_level = None
+
+    @event.listens_for(sync_engine, "begin")
+    def _begin_sqlite_transaction(conn):
+        # IMMEDIATE: жазу құлпы транзакция басында алынады, сондықтан "оқы, сосын жаз"
+        # көмекшілері (rollup, batch update) бір-бірімен араласпайды. Тек оқитын
+        # сессиялар READ_ONLY_OPTIONS арқылы DEFERRED бастайды.
+        conn.exec_driver_sql(f"BEGIN {conn.get_execution_options().get('sqlite_begin', 'IMMEDIATE')}")
+
+# Тек оқитын сессиялардың engine.execution_options(...) параметрлері (PostgreSQL-де әсері жоқ)
+READ_ONLY_OPTIONS = {"sqlite_begin": "DEFERRED"}
+
+def make_engine(database_url: str):
+    engine = create_engine(database_url, **engine_options(database_url))
+    install_sqlite_pragmas(engine)
+    return engine
+
+def pool_stats(engine) -> dict:
+    pool = engine.pool
+    stats = {"pool_class": type(pool).__name__}
+    if isinstance(pool, QueuePool):
+        stats.update({
+            "size": pool.size(),
+            "checked_in": pool.checkedin(),
+            "checked_out": pool.checkedout(),
+            "overflow": max(pool.overflow(), 0),
+            "max_overflow": pool._max_overflow,
+        })
+    if isinstance(pool, TimedQueuePool):
+        stats.update({
+            "checkouts": pool.wait_count,
+            "wait_avg_ms": pool.wait_total / pool.wait_count * 1000 if pool.wait_count else 0.0,
+            "wait_max_ms": pool.wait_max * 1000,
+            "timeouts": pool.timeouts,
+        })
+    return stats
+
+engine = make_engine(SQLALCHEMY_DATABASE_URL)
+read_engine = engine.execution_options(**READ_ONLY_OPTIONS)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+# Негізгі база, бірақ жазу құлпынсыз: токен тексеру, экспорт сияқты тек оқитын жұмыстар
+ReadSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=read_engine)
+
+# --- REPLICA МАРШРУТТАУЫ ---
+# Тек оқитын dependency-лер репликаларға (кезекпен) барады. Жазған клиент
+# READ_YOUR_WRITES_SECONDS бойы негізгі базаға бекітіледі: реплика артта
+# қалса да өз өзгерістерін көреді. Бекіту процесс жадында емес, клиентте
+# (cookie немесе тақырып), сондықтан келесі оқу кез келген воркерге түсе алады.
+DATABASE_REPLICA_URLS = [url.strip() for url in os.getenv("DATABASE_REPLICA_URLS", "").split(",") if url.strip()]
+REPLICA_HEALTH_INTERVAL = float(os.getenv("REPLICA_HEALTH_INTERVAL", "5"))
+READ_YOUR_WRITES_SECONDS = float(os.getenv("READ_YOUR_WRITES_SECONDS", "5"))
+
+
+class ReplicaRouter:
+    """Round-robin over healthy replica engines, falling back to the primary."""
+
+    def __init__(self, primary, replicas, health_interval: float):
+        self.primary = primary
+        self.replicas = list(replicas)
+        self.health_interval = health_interval
+        self._lock = threading.Lock()
+        self._next = 0
+        self._health = {id(replica): (True, 0.0) for replica in self.replicas}
+
+    def _check(self, replica) -> bool:
+        # SELECT 1 тек байланысты тексереді; нақты кестені оқу схемасы жоқ/бұзылған репликаны да ұстайды
+        try:
+            with replica.connect() as conn:
+                conn.exec_driver_sql("SELECT id FROM users ORDER BY id DESC LIMIT 1")
+            return True
+        except Exception:
+            return False
+
+    def is_healthy(self, replica) -> bool:
+        healthy, checked_at = self._health[id(replica)]
+        now = time.monotonic()
+        if now - checked_at >= self.health_interval:
+            healthy = self._check(replica)
+            self._health[id(replica)] = (healthy, now)
+        return healthy
+
+    def mark_unhealthy(self, replica):
+        if id(replica) in self._health:
+            self._health[id(replica)] = (False, time.monotonic())
+
+    def pick(self, pinned: bool = False):
+        if not self.replicas or pinned:
+            return self.primary
+        with self._lock:
+            start = self._next
+            self._next = (self._next + 1) % len(self.replicas)
+        for offset in range(len(self.replicas)):
+            replica = self.replicas[(start + offset) % len(self.replicas)]
+            if self.is_healthy(replica):
+                return replica
+        return self.primary
+
+    def stats(self) -> list:
+        return [{"url": replica.url.render_as_string(hide_password=True),
+                 "healthy": self._health[id(replica)][0], **pool_stats(replica)} for replica in self.replicas]
+
+
+replica_engines = [make_engine(url) for url in DATABASE_REPLICA_URLS]
+replica_router = ReplicaRouter(engine, replica_engines, REPLICA_HEALTH_INTERVAL)
+
+PIN_COOKIE = "rw_pin"
+PIN_HEADER = "X-Read-Your-Writes-Until"
+_request_writes = contextvars.ContextVar("request_writes", default=None)
+
+
+def note_write():
+    # crud.bump_data_version шақырады; жауапқа бекітуді ReadYourWritesMiddleware қосады
+    writes = _request_writes.get()
+    if writes is not None:
+        writes["wrote"] = True
+
+
+def is_pinned(cookies, headers) -> bool:
+    value = cookies.get(PIN_COOKIE) or headers.get(PIN_HEADER)
+    try:
+        return float(value) > time.time()
+    except (TypeError, ValueError):
+        return False
+
+
+class ReadYourWritesMiddleware:
+    """Pure ASGI: a successful response to a request that wrote ledger data carries the pin deadline."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        # Mounted sub-apps see the parent's scope keys: pin only once
+        if scope["type"] != "http" or not replica_router.replicas or "rw.writes" in scope:
+            await self.app(scope, receive, send)
+            return
+        writes = scope["rw.writes"] = {}
+        token = _request_writes.set(writes)
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start" and writes and message["status"] < 400:
+                deadline = f"{time.time() + READ_YOUR_WRITES_SECONDS:.3f}"
+                max_age = max(1, math.ceil(READ_YOUR_WRITES_SECONDS))
+                message["headers"] = list(message.get("headers", [])) + [
+                    (b"set-cookie", f"{PIN_COOKIE}={deadline}; Max-Age={max_age}; Path=/; HttpOnly; SameSite=Lax".encode()),
+                    (PIN_HEADER.lower().encode(), deadline.encode()),
+                ]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            _request_writes.reset(token)
+
+
+def read_session(pinned: bool = False):
+    # Реплика қосылмаса, оны health_interval бойы айналып өтіп, келесісін (соңында негізгі базаны) аламыз.
+    # Таңдалған реплика db.info["replica"]-да: сұраным кезіндегі қатеде оны mark_unhealthy алады
+    replica = replica_router.pick(pinned)
+    db = SessionLocal(bind=replica.execution_options(**READ_ONLY_OPTIONS))
+    if replica is replica_router.primary:
+        return db
+    try:
+        db.connection()
+    except DBAPIError:
+        db.close()
+        replica_router.mark_unhealthy(replica)
+        return read_session(pinned)
+    db.info["replica"] = replica
+    return db
 Base = declarative_base()
 
 def get_db():
@@ -20,4 +289,4 @@ def get_db():
     try:
         yield db
     finally:
-        db.close()
\ No newline at end of file
+        db.close()
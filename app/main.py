@@ -1,22 +1,70 @@
-from fastapi import FastAPI, Depends, HTTPException, status, Request
+from fastapi import FastAPI, Depends, HTTPException, status, Request, Response, Query, BackgroundTasks
 from fastapi.security import OAuth2PasswordRequestForm, OAuth2PasswordBearer
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse, JSONResponse, PlainTextResponse
+from fastapi.concurrency import run_in_threadpool
 from sqlalchemy.orm import Session
-from datetime import timedelta, datetime
+from sqlalchemy.exc import DBAPIError
+from datetime import timedelta, datetime, date
 from typing import List, Optional
 from jose import jwt, JWTError
 from pydantic import BaseModel
-from . import models, database, schemas, crud, utils
+from contextlib import asynccontextmanager
+import asyncio
+import csv
+import hashlib
+import io
+import itertools
+import json
+import os
+import threading
+import time
+from . import models, database, schemas, crud, utils, serializers, metrics, account_deletion, search, notifications
+from .cache import TTLCache
 
 
 # --- КОНСТАНТАЛАР (ӨЗГЕРТПЕҢІЗ) ---
 SECRET_KEY = "YOUR-ULTRA-SECRET-KEY"
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 30
-
-app = FastAPI()
+TELEGRAM_BOT_TOKEN = os.getenv("TELEGRAM_BOT_TOKEN")
+NOTIFICATIONS_FAKE = os.getenv("NOTIFICATIONS_FAKE", "0") == "1"
+
+# Тізімдерді ORM/pydantic арқылы емес, бағандардан тікелей JSON-ға жазу
+FAST_LIST_SERIALIZATION = os.getenv("FAST_LIST_SERIALIZATION", "0") == "1"
+encode_expenses = serializers.make_list_encoder(schemas.ExpenseResponse)
+encode_incomes = serializers.make_list_encoder(schemas.IncomeResponse)
+encode_categories = serializers.make_list_encoder(schemas.CategoryResponse)
+encode_budgets = serializers.make_list_encoder(schemas.BudgetResponse)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Үзіліп қалған аккаунт өшірулерін фонда аяқтаймыз
+    threading.Thread(target=account_deletion.resume_pending_deletions, name="account-purge-resume", daemon=True).start()
+    # Outbox-тағы хабарламаларды жіберетін фон тапсырмасы
+    dispatcher = task = None
+    if TELEGRAM_BOT_TOKEN or NOTIFICATIONS_FAKE:
+        sender = notifications.FakeSender() if NOTIFICATIONS_FAKE else notifications.TelegramSender(TELEGRAM_BOT_TOKEN)
+        dispatcher = notifications.OutboxDispatcher(sender)
+        task = asyncio.create_task(dispatcher.run())
+    app.state.notification_dispatcher = dispatcher
+    yield
+    if dispatcher is not None:
+        dispatcher.stop()
+        await task
+        await dispatcher.sender.close()
+
+app = FastAPI(lifespan=lifespan)
 
 database.Base.metadata.create_all(bind=database.engine) 
+# create_all бар кестелерге жаңа индекстерді қоспайды
+for table in database.Base.metadata.sorted_tables:
+    for index in table.indexes:
+        index.create(bind=database.engine, checkfirst=True)
+search.install_search_index(database.engine)
+# Rollup кестелерінен бұрын тіркелген қолданушылар үшін бір реттік толтыру
+with database.SessionLocal() as _backfill_db:
+    crud.backfill_missing_rollups(_backfill_db)
 
 
 
@@ -26,7 +74,17 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "ETag", database.PIN_HEADER],
 )
+app.add_middleware(database.ReadYourWritesMiddleware)
+app.add_middleware(metrics.MetricsMiddleware)
+metrics.install_sql_instrumentation(database.engine)
+for replica_engine in database.replica_engines:
+    metrics.install_sql_instrumentation(replica_engine)
+
+@app.exception_handler(utils.PasswordHasherBusy)
+def password_hasher_busy_handler(request: Request, exc: utils.PasswordHasherBusy):
+    return JSONResponse(status_code=503, content={"detail": "Сервер бос емес, кейінірек қайталаңыз"}, headers={"Retry-After": "1"})
 
 
 # --- DEPENDENCIES ---
@@ -37,8 +95,28 @@ def get_db():
     finally:
         db.close()
 
+def read_primary(fn, *args, **kwargs):
+    # Негізгі базадан қысқа оқу (SQLite-та жазу құлпынсыз): байланыс dependency
+    # сияқты сұраным соңына дейін емес, осы шақырудан кейін бірден пулға қайтады
+    with database.ReadSessionLocal() as db:
+        return fn(db, *args, **kwargs)
+
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
 
+def json_bytes_response(body: bytes, response: Response):
+    # Тікелей қайтарылған Response-қа тәуелділіктер қойған тақырыптар (ETag т.б.) өздігінен көшпейді
+    headers = {key: value for key, value in response.headers.items() if key != "content-length"}
+    return Response(content=body, media_type="application/json", headers=headers)
+
+def ledger_filters(
+    limit: int = Query(100, ge=1, le=1000),
+    after: Optional[str] = None,
+    date_from: Optional[date] = None,
+    date_to: Optional[date] = None,
+    category_id: Optional[int] = None,
+):
+    return {"limit": limit, "after": after, "date_from": date_from, "date_to": date_to, "category_id": category_id}
+
 
 # --- АУТЕНТИФИКАЦИЯ ЖӘНЕ ТОКЕН ФУНКЦИЯЛАРЫ ---
 def create_access_token(data: dict):
@@ -47,30 +125,124 @@ def create_access_token(data: dict):
     to_encode.update({"exp": expire})
     return jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
 
-def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
+# Тексерілген токен -> қолданушы (principal) кэші. Кэш процесс ішінде, ал
+# нұсқа ортақ базада (user_auth_versions): профиль/құпия сөз өзгергенде не
+# аккаунт өшірілгенде ол өседі, сондықтан кэштелген токен кез келген воркерде
+# бірден жарамсыз болады. Кэш тигенде users кестесі оқылмайды, тек нұсқа.
+PRINCIPAL_CACHE_TTL = float(os.getenv("PRINCIPAL_CACHE_TTL", "60"))
+PRINCIPAL_CACHE_SIZE = int(os.getenv("PRINCIPAL_CACHE_SIZE", "10000"))
+principal_cache = TTLCache(maxsize=PRINCIPAL_CACHE_SIZE, ttl=PRINCIPAL_CACHE_TTL)
+
+# Токен/кэш логикасы екі қосымшаға ортақ; async_main тек ДБ шақыруын ауыстырады
+def decode_access_token(token: str) -> dict:
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        email: str = payload.get("sub")
-        if email is None: raise HTTPException(status_code=401, detail="Invalid token")
     except JWTError: raise HTTPException(status_code=401, detail="Invalid token")
-    user = crud.get_user_by_email(db, email=email)
+    if payload.get("sub") is None: raise HTTPException(status_code=401, detail="Invalid token")
+    return payload
+
+def remember_principal(token: str, payload: dict, user: Optional[models.User], version: Optional[int]) -> schemas.User:
+    if user is None or user.email != payload["sub"]: raise HTTPException(status_code=401, detail="User not found")
+    if not user.is_active: raise HTTPException(status_code=401, detail="Аккаунт өшірілген")
+    principal = schemas.User.model_validate(user)
+    if version is not None:
+        principal_cache.set(token, (principal, version), ttl=payload["exp"] - time.time())
+    return principal
+
+def get_current_user(token: str = Depends(oauth2_scheme)):
+    # Қысқа сессия: байланыс маршрут өз сессиясын алмай тұрып пулға қайтады,
+    # әйтпесе әр сұраным екі байланыс ұстап, пул толғанда бәрі бір-бірін күтеді
+    with database.ReadSessionLocal() as db:
+        cached = principal_cache.get(token)
+        if cached is not None:
+            principal, version = cached
+            if crud.get_auth_version(db, principal.id) == version:
+                return principal
+        payload = decode_access_token(token)
+        # Жаңа токендерде uid бар: іздеу email индексі емес, бастапқы кілт бойынша.
+        # Нұсқа қолданушы жолынан бұрын оқылады: арада өскен нұсқа кэшке түспейді
+        user_id = payload.get("uid")
+        if user_id is None:
+            return remember_principal(token, payload, crud.get_user_by_email(db, email=payload["sub"]), None)
+        version = crud.get_auth_version(db, user_id)
+        return remember_principal(token, payload, db.get(models.User, user_id), version)
+
+def get_current_user_model(current_user: schemas.User = Depends(get_current_user), db: Session = Depends(get_db)):
+    # Қолданушы жолын өзгертетін маршруттарға сессияға тіркелген ORM объектісі керек
+    user = db.get(models.User, current_user.id)
     if user is None: raise HTTPException(status_code=401, detail="User not found")
     return user
 
 
+def get_read_db(request: Request, current_user: schemas.User = Depends(get_current_user)):
+    # Тек оқитын маршруттар: реплика (бар болса), жуырда жазған клиент үшін негізгі база.
+    # data_etag те осы сессияны алады, сондықтан ETag нұсқасы мен дерек бір көзден оқылады
+    db = database.read_session(database.is_pinned(request.cookies, request.headers))
+    try:
+        yield db
+    except DBAPIError:
+        # Реплика сұраным ортасында құлады: келесі сұранымдар негізгі базаға барады
+        if "replica" in db.info:
+            database.replica_router.mark_unhealthy(db.info["replica"])
+        raise
+    finally:
+        db.close()
+
+def data_etag(request: Request, response: Response, current_user: schemas.User = Depends(get_current_user), db: Session = Depends(get_read_db)):
+    # ETag = қолданушы деректерінің нұсқасы + сұраным жолы; өзгеріс болмаса
+    # ledger кестелеріне тиіспей 304 қайтарамыз
+    apply_data_etag(request, response, current_user.id, crud.get_data_version(db, current_user.id))
+
+def apply_data_etag(request: Request, response: Response, user_id: int, version: int):
+    digest = hashlib.sha1(f"{user_id}:{request.url.path}?{request.url.query}".encode()).hexdigest()[:16]
+    etag = f'W/"{version}-{digest}"'
+    if_none_match = request.headers.get("if-none-match", "")
+    if etag in [tag.strip() for tag in if_none_match.split(",")] or if_none_match.strip() == "*":
+        raise HTTPException(status_code=status.HTTP_304_NOT_MODIFIED, headers={"ETag": etag})
+    response.headers["ETag"] = etag
+    response.headers["Cache-Control"] = "private, no-cache"
+
+
+# --- ДБ ПУЛЫНЫҢ КҮЙІ ЖӘНЕ МЕТРИКАЛАР ---
+@app.get("/health/pool/")
+def read_pool_stats():
+    stats = database.pool_stats(database.engine)
+    if database.replica_engines:
+        stats["replicas"] = database.replica_router.stats()
+    return stats
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def read_metrics():
+    lines = [metrics.registry.render()]
+    for key, value in database.pool_stats(database.engine).items():
+        if isinstance(value, (int, float)):
+            lines.append(f"db_pool_{key} {value}\n")
+    return PlainTextResponse("".join(lines), media_type="text/plain; version=0.0.4")
+
+
 # --- АУТЕНТИФИКАЦИЯ (ТІРКЕЛУ/КІРУ) ---
+# Хэштеу бөлек пулда жүреді: бұл маршруттар async, ДБ шақырулары threadpool-да,
+# ал хэш есептелгенше ешбір threadpool слоты ұсталмайды
 @app.post("/users/", response_model=schemas.User)
-def register(user: schemas.UserCreate, db: Session = Depends(get_db)):
-    if crud.get_user_by_email(db, email=user.email):
+async def register(user: schemas.UserCreate, db: Session = Depends(get_db)):
+    if await run_in_threadpool(read_primary, crud.get_user_by_email, email=user.email):
         raise HTTPException(status_code=400, detail="Бұл email тіркелген!")
-    return crud.create_user(db=db, user=user)
+    hashed_password = await utils.get_password_hash_async(user.password)
+    return await run_in_threadpool(crud.create_user, db=db, user=user, hashed_password=hashed_password)
 
 @app.post("/token")
-def login(form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(get_db)):
-    user = crud.get_user_by_email(db, email=form_data.username)
-    if not user or not utils.verify_password(form_data.password, user.hashed_password):
+async def login(form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(get_db)):
+    # Хэш тексерілгенше жазу транзакциясы ашылмауы керек, сондықтан іздеу бөлек оқу сессиясында
+    user = await run_in_threadpool(read_primary, crud.get_user_by_email, email=form_data.username)
+    if not user or not user.is_active:
+        raise HTTPException(status_code=401, detail="Қате email немесе құпия сөз")
+    verified, new_hash = await utils.verify_and_update_password_async(form_data.password, user.hashed_password)
+    if not verified:
         raise HTTPException(status_code=401, detail="Қате email немесе құпия сөз")
-    access_token = create_access_token(data={"sub": user.email})
+    if new_hash:
+        # Хэш құны ескірген: жаңа параметрлермен қайта сақтаймыз
+        await run_in_threadpool(crud.update_user_password_hash, db, user.id, new_hash)
+    access_token = create_access_token(data={"sub": user.email, "uid": user.id})
     return {"access_token": access_token, "token_type": "bearer"}
 
 @app.get("/users/me/", response_model=schemas.User)
@@ -83,19 +255,99 @@ def read_users_me(current_user: schemas.User = Depends(get_current_user)):
 def add_category(category: schemas.CategoryCreate, db: Session = Depends(get_db), current_user: schemas.User = Depends(get_current_user)):
     return crud.create_user_category(db, category, current_user.id)
 
-@app.get("/categories/", response_model=List[schemas.CategoryResponse])
-def get_categories(db: Session = Depends(get_db), current_user: schemas.User = Depends(get_current_user)):
+@app.get("/categories/", response_model=List[schemas.CategoryResponse], dependencies=[Depends(data_etag)])
+def get_categories(response: Response, db: Session = Depends(get_read_db), current_user: schemas.User = Depends(get_current_user)):
+    if FAST_LIST_SERIALIZATION:
+        return json_bytes_response(encode_categories(crud.get_user_category_rows(db, current_user.id)), response)
     return crud.get_user_categories(db, current_user.id)
 
 
+# --- ТОПТАП ЕНГІЗУ (BULK IMPORT) ---
+BULK_MAX_ROWS = 10000
+
+def _parse_csv_rows(data: bytes):
+    # Кодировкасы/пішімі бұзық файл клиенттің қатесі: 500 емес, 400
+    try:
+        return [{key: (value if value != "" else None) for key, value in row.items()}
+                for row in csv.DictReader(io.StringIO(data.decode("utf-8-sig")))]
+    except UnicodeDecodeError:
+        raise HTTPException(status_code=400, detail="CSV UTF-8 кодировкасында болуы керек")
+    except csv.Error as e:
+        raise HTTPException(status_code=400, detail=f"Қате CSV: {e}")
+
+async def read_bulk_rows(request: Request):
+    # JSON массиві, text/csv денесі немесе multipart "file" өрісіндегі CSV
+    content_type = request.headers.get("content-type", "")
+    if content_type.startswith("multipart/form-data"):
+        form = await request.form()
+        upload = form.get("file")
+        if upload is None or isinstance(upload, str):
+            raise HTTPException(status_code=400, detail="CSV файлы (file) табылмады")
+        rows = _parse_csv_rows(await upload.read())
+    elif content_type.startswith("text/csv"):
+        rows = _parse_csv_rows(await request.body())
+    else:
+        try:
+            rows = await request.json()
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Қате JSON")
+        if not isinstance(rows, list):
+            raise HTTPException(status_code=400, detail="JSON массиві күтілді")
+    if len(rows) > BULK_MAX_ROWS:
+        raise HTTPException(status_code=413, detail=f"Бір сұранымда {BULK_MAX_ROWS} жолдан артық болмауы керек")
+    return rows
+
+
 # --- ШЫҒЫНДАР (EXPENSES) ---
-@app.post("/expenses/", response_model=schemas.ExpenseResponse)
+@app.post("/expenses/", response_model=schemas.ExpenseCreateResponse)
 def add_expense(expense: schemas.ExpenseCreate, db: Session = Depends(get_db), current_user: schemas.User = Depends(get_current_user)):
     return crud.create_user_expense(db, expense, current_user.id)
 
-@app.get("/expenses/", response_model=List[schemas.ExpenseResponse])
-def get_expenses(db: Session = Depends(get_db), current_user: schemas.User = Depends(get_current_user)):
-    return crud.get_user_expenses(db, current_user.id)
+@app.post("/expenses/bulk", response_model=schemas.BulkInsertResult)
+async def add_expenses_bulk(rows: list = Depends(read_bulk_rows), db: Session = Depends(get_db), current_user: schemas.User = Depends(get_current_user)):
+    return await run_in_threadpool(crud.bulk_create_user_expenses, db, rows, current_user.id)
+
+@app.get("/expenses/", response_model=List[schemas.ExpenseResponse], dependencies=[Depends(data_etag)])
+def get_expenses(response: Response, filters: dict = Depends(ledger_filters), db: Session = Depends(get_read_db), current_user: schemas.User = Depends(get_current_user)):
+    page = crud.get_user_expense_rows_page if FAST_LIST_SERIALIZATION else crud.get_user_expenses_page
+    try:
+        items, next_cursor = page(db, current_user.id, **filters)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Қате курсор")
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
+    if FAST_LIST_SERIALIZATION:
+        return json_bytes_response(encode_expenses(items), response)
+    return items
+
+def batch_selection(body: schemas.ExpenseSelection) -> dict:
+    return body.model_dump(include={"ids", "category_id", "date_from", "date_to"})
+
+@app.post("/expenses/batch-update", response_model=schemas.BatchResult)
+def batch_update_expenses(body: schemas.ExpenseBatchUpdate, db: Session = Depends(get_db), current_user: schemas.User = Depends(get_current_user)):
+    try:
+        return {"affected": crud.update_user_expenses(db, current_user.id, body.changes, **batch_selection(body))}
+    except ValueError:
+        raise HTTPException(status_code=400, detail="ids, category_id немесе күн аралығы көрсетілуі керек")
+    except LookupError:
+        raise HTTPException(status_code=404, detail="Санат табылмады")
+
+@app.post("/expenses/batch-delete", response_model=schemas.BatchResult)
+def batch_delete_expenses(body: schemas.ExpenseSelection, db: Session = Depends(get_db), current_user: schemas.User = Depends(get_current_user)):
+    try:
+        return {"affected": crud.delete_user_expenses(db, current_user.id, **batch_selection(body))}
+    except ValueError:
+        raise HTTPException(status_code=400, detail="ids, category_id немесе күн аралығы көрсетілуі керек")
+
+@app.patch("/expenses/{expense_id}", response_model=schemas.ExpenseResponse)
+def update_expense(expense_id: int, changes: schemas.ExpenseUpdate, db: Session = Depends(get_db), current_user: schemas.User = Depends(get_current_user)):
+    try:
+        expense = crud.update_user_expense(db, expense_id, current_user.id, changes)
+    except LookupError:
+        raise HTTPException(status_code=404, detail="Санат табылмады")
+    if expense is None:
+        raise HTTPException(status_code=404, detail="Шығын табылмады")
+    return expense
 
 @app.delete("/expenses/{expense_id}")
 def delete_expense(expense_id: int, db: Session = Depends(get_db), current_user: schemas.User = Depends(get_current_user)):
@@ -108,30 +360,117 @@ def delete_expense(expense_id: int, db: Session = Depends(get_db), current_user:
 def add_income(income: schemas.IncomeCreate, db: Session = Depends(get_db), current_user: schemas.User = Depends(get_current_user)):
     return crud.create_user_income(db, income, current_user.id)
 
-@app.get("/incomes/", response_model=List[schemas.IncomeResponse])
-def get_incomes(db: Session = Depends(get_db), current_user: schemas.User = Depends(get_current_user)):
-    return crud.get_user_incomes(db, current_user.id)
+@app.post("/incomes/bulk", response_model=schemas.BulkInsertResult)
+async def add_incomes_bulk(rows: list = Depends(read_bulk_rows), db: Session = Depends(get_db), current_user: schemas.User = Depends(get_current_user)):
+    return await run_in_threadpool(crud.bulk_create_user_incomes, db, rows, current_user.id)
+
+@app.get("/incomes/", response_model=List[schemas.IncomeResponse], dependencies=[Depends(data_etag)])
+def get_incomes(response: Response, filters: dict = Depends(ledger_filters), db: Session = Depends(get_read_db), current_user: schemas.User = Depends(get_current_user)):
+    page = crud.get_user_income_rows_page if FAST_LIST_SERIALIZATION else crud.get_user_incomes_page
+    try:
+        items, next_cursor = page(db, current_user.id, **filters)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Қате курсор")
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
+    if FAST_LIST_SERIALIZATION:
+        return json_bytes_response(encode_incomes(items), response)
+    return items
 
 
 # --- БАЛАНС ЖӘНЕ СТАТИСТИКА ---
-@app.get("/balance/", response_model=schemas.BalanceResponse)
-def get_balance(db: Session = Depends(get_db), current_user: schemas.User = Depends(get_current_user)):
+@app.get("/balance/", response_model=schemas.BalanceResponse, dependencies=[Depends(data_etag)])
+def get_balance(db: Session = Depends(get_read_db), current_user: schemas.User = Depends(get_current_user)):
     return crud.get_user_balance(db, current_user.id)
 
-@app.get("/statistics/expenses/", response_model=List[schemas.CategoryStats])
-def get_stats(db: Session = Depends(get_db), current_user: schemas.User = Depends(get_current_user)):
+@app.get("/statistics/expenses/", response_model=List[schemas.CategoryStats], dependencies=[Depends(data_etag)])
+def get_stats(db: Session = Depends(get_read_db), current_user: schemas.User = Depends(get_current_user)):
     return crud.get_expenses_by_category(db, current_user.id)
 
+@app.get("/statistics/timeseries/", response_model=List[schemas.TimeseriesPoint], dependencies=[Depends(data_etag)])
+def get_timeseries(
+    bucket: str = Query("month", pattern="^(day|week|month)$"),
+    date_from: Optional[date] = None,
+    date_to: Optional[date] = None,
+    by_category: bool = False,
+    db: Session = Depends(get_read_db),
+    current_user: schemas.User = Depends(get_current_user)
+):
+    return crud.get_timeseries(db, current_user.id, bucket=bucket, date_from=date_from, date_to=date_to, by_category=by_category)
+
+
+# --- ІЗДЕУ ---
+@app.get("/search/", response_model=List[schemas.SearchResult], dependencies=[Depends(data_etag)])
+def search_ledger(
+    q: str = Query(..., min_length=1, max_length=200),
+    type: Optional[str] = Query(None, pattern="^(expense|income)$"),
+    amount_min: Optional[float] = None,
+    amount_max: Optional[float] = None,
+    date_from: Optional[date] = None,
+    date_to: Optional[date] = None,
+    category_id: Optional[int] = None,
+    limit: int = Query(50, ge=1, le=200),
+    db: Session = Depends(get_read_db),
+    current_user: schemas.User = Depends(get_current_user)
+):
+    return crud.search_user_ledger(db, current_user.id, q, kind=type, amount_min=amount_min, amount_max=amount_max,
+                                   date_from=date_from, date_to=date_to, category_id=category_id, limit=limit)
+
+
+# --- ЭКСПОРТ (CSV / NDJSON) ---
+EXPORT_FLUSH_ROWS = 500
+
+def export_header(export_format: str) -> bytes:
+    return (",".join(crud.LEDGER_EXPORT_COLUMNS) + "\r\n").encode("utf-8") if export_format == "csv" else b""
+
+def encode_export_rows(rows, export_format: str) -> bytes:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for row in rows:
+        values = list(row)
+        values[2] = values[2].date().isoformat() if values[2] else None
+        if export_format == "csv":
+            writer.writerow(values)
+        else:
+            buffer.write(json.dumps(dict(zip(crud.LEDGER_EXPORT_COLUMNS, values)), ensure_ascii=False) + "\n")
+    return buffer.getvalue().encode("utf-8")
+
+def _stream_ledger(user_id: int, export_format: str):
+    # Ағын жауап жіберілгенше созылады, сондықтан өз сессиясын ашады
+    db = database.ReadSessionLocal()
+    try:
+        yield export_header(export_format)
+        rows = crud.iter_user_ledger(db, user_id)
+        while chunk := list(itertools.islice(rows, EXPORT_FLUSH_ROWS)):
+            yield encode_export_rows(chunk, export_format)
+    finally:
+        db.close()
+
+@app.get("/export/")
+def export_ledger(format: str = Query("csv", pattern="^(csv|ndjson)$"), current_user: schemas.User = Depends(get_current_user)):
+    media_type = "text/csv" if format == "csv" else "application/x-ndjson"
+    return StreamingResponse(
+        _stream_ledger(current_user.id, format),
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="ledger.{format}"'},
+    )
+
 
 # --- БЮДЖЕТ API ---
 @app.post("/budgets/", response_model=schemas.BudgetResponse)
 def create_budget(budget: schemas.BudgetCreate, db: Session = Depends(get_db), current_user: schemas.User = Depends(get_current_user)):
     return crud.create_budget(db=db, budget=budget, user_id=current_user.id)
 
-@app.get("/budgets/", response_model=List[schemas.BudgetResponse])
-def read_budgets(db: Session = Depends(get_db), current_user: schemas.User = Depends(get_current_user)):
+@app.get("/budgets/", response_model=List[schemas.BudgetResponse], dependencies=[Depends(data_etag)])
+def read_budgets(response: Response, db: Session = Depends(get_read_db), current_user: schemas.User = Depends(get_current_user)):
+    if FAST_LIST_SERIALIZATION:
+        return json_bytes_response(encode_budgets(crud.get_user_budget_rows(db, user_id=current_user.id)), response)
     return crud.get_user_budgets(db, user_id=current_user.id)
 
+@app.get("/budgets/status/", response_model=List[schemas.BudgetStatus], dependencies=[Depends(data_etag)])
+def read_budget_statuses(db: Session = Depends(get_read_db), current_user: schemas.User = Depends(get_current_user)):
+    return crud.get_user_budget_statuses(db, user_id=current_user.id)
+
 class UserUpdate(BaseModel):
     username: Optional[str] = None 
     email: Optional[str] = None
@@ -144,7 +483,7 @@ class UserPasswordUpdate(BaseModel):
 def update_user_profile(
     user_data: UserUpdate, 
     db: Session = Depends(get_db), 
-    current_user: models.User = Depends(get_current_user)
+    current_user: models.User = Depends(get_current_user_model)
 ):
     if user_data.email and user_data.email != current_user.email:
         existing_user = crud.get_user_by_email(db, email=user_data.email)
@@ -156,6 +495,7 @@ def update_user_profile(
         current_user.username = user_data.username
     
     try:
+        crud.bump_auth_version(db, current_user.id)
         db.commit()
         db.refresh(current_user)
     except Exception as e:
@@ -165,28 +505,53 @@ def update_user_profile(
     return current_user
 
 @app.put("/users/password")
-def change_user_password(
+async def change_user_password(
     pass_data: UserPasswordUpdate, 
     db: Session = Depends(get_db), 
-    current_user: models.User = Depends(get_current_user)
+    current_user: schemas.User = Depends(get_current_user)
 ):
-    if not utils.verify_password(pass_data.old_password, current_user.hashed_password):
+    user = await run_in_threadpool(read_primary, Session.get, models.User, current_user.id)
+    if not await utils.verify_password_async(pass_data.old_password, user.hashed_password):
         raise HTTPException(status_code=400, detail="Ескі құпия сөз қате!")
 
-    current_user.hashed_password = utils.get_password_hash(pass_data.new_password)
-    db.commit()
+    hashed_password = await utils.get_password_hash_async(pass_data.new_password)
+    await run_in_threadpool(crud.update_user_password_hash, db, current_user.id, hashed_password)
     
     return {"message": "Құпия сөз сәтті өзгертілді!"}
 
-@app.delete("/users/me")
+@app.put("/users/me/telegram")
+def link_telegram(
+    link: schemas.TelegramLink,
+    db: Session = Depends(get_db),
+    current_user: models.User = Depends(get_current_user_model)
+):
+    taken = db.query(models.User.id).filter(models.User.telegram_chat_id == link.telegram_chat_id, models.User.id != current_user.id).first()
+    if taken:
+        raise HTTPException(status_code=400, detail="Бұл Telegram чаты басқа аккаунтқа байланған!")
+    current_user.telegram_chat_id = link.telegram_chat_id
+    db.commit()
+    return {"message": "Telegram сәтті байланды!"}
+
+@app.delete("/users/me/telegram")
+def unlink_telegram(db: Session = Depends(get_db), current_user: models.User = Depends(get_current_user_model)):
+    current_user.telegram_chat_id = None
+    db.commit()
+    return {"message": "Telegram ажыратылды"}
+
+@app.delete("/users/me", status_code=status.HTTP_202_ACCEPTED)
 def delete_user_me(
+    background_tasks: BackgroundTasks,
     db: Session = Depends(get_db), 
-    current_user: models.User = Depends(get_current_user)
+    current_user: models.User = Depends(get_current_user_model)
 ):
+    # Аккаунт бірден өшіріледі (is_active=False), деректер фонда бөліктеп тазаланады.
+    # user_id коммитке дейін алынады: коммиттен кейінгі оқу сессияда жаңа (SQLite-та
+    # жазу құлпын ұстайтын) транзакция ашып, фондағы тазалауды бөгер еді
+    user_id = current_user.id
     try:
-        db.delete(current_user)
-        db.commit()
-        return {"message": "Аккаунт және барлық деректер сәтті өшірілді!"}
+        account_deletion.request_account_deletion(db, current_user)
     except Exception as e:
         db.rollback()
         raise HTTPException(status_code=500, detail="Өшіру кезінде қате шықты")
+    background_tasks.add_task(account_deletion.purge_account, user_id)
+    return {"message": "Аккаунт өшірілді, деректер фонда тазалануда"}
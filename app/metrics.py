@@ -0,0 +1,179 @@
+"""Request and SQL instrumentation with a Prometheus text endpoint.
+
+MetricsMiddleware times every request by route template and status code.
+SQLAlchemy cursor hooks count and time the queries each request issues, so
+N+1 patterns show up as a high queries-per-request histogram. Statements
+slower than SLOW_QUERY_MS are logged with their SQL normalized. Everything is
+kept in process memory; METRICS_ENABLED=0 turns the hooks off.
+"""
+import bisect
+import logging
+import os
+import re
+import threading
+import time
+from contextvars import ContextVar
+
+from sqlalchemy import event
+
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "1") == "1"
+SLOW_QUERY_MS = float(os.getenv("SLOW_QUERY_MS", "200"))
+
+logger = logging.getLogger("app.slow_query")
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.total += value
+        self.count += 1
+
+
+class Registry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.request_latency = {}   # (method, route) -> Histogram
+        self.request_queries = {}   # (method, route) -> Histogram
+        self.request_sql_time = {}  # (method, route) -> seconds
+        self.responses = {}         # (method, route, status) -> count
+        self.query_latency = Histogram(LATENCY_BUCKETS)
+        self.slow_queries = 0
+
+    def observe_request(self, method, route, status, duration, queries, sql_time):
+        key = (method, route)
+        with self._lock:
+            self.request_latency.setdefault(key, Histogram(LATENCY_BUCKETS)).observe(duration)
+            self.request_queries.setdefault(key, Histogram(QUERY_COUNT_BUCKETS)).observe(queries)
+            self.request_sql_time[key] = self.request_sql_time.get(key, 0.0) + sql_time
+            status_key = (method, route, status)
+            self.responses[status_key] = self.responses.get(status_key, 0) + 1
+
+    def observe_query(self, duration, slow):
+        with self._lock:
+            self.query_latency.observe(duration)
+            if slow:
+                self.slow_queries += 1
+
+    def render(self) -> str:
+        lines = []
+        with self._lock:
+            _render_histogram(lines, "http_request_duration_seconds", "Request latency by route",
+                              self.request_latency, ("method", "route"))
+            _render_histogram(lines, "http_request_db_queries", "SQL statements issued per request",
+                              self.request_queries, ("method", "route"))
+            lines.append("# HELP http_request_db_seconds_total Time spent in SQL per route")
+            lines.append("# TYPE http_request_db_seconds_total counter")
+            for (method, route), value in sorted(self.request_sql_time.items()):
+                lines.append(f'http_request_db_seconds_total{{method="{method}",route="{_escape(route)}"}} {value}')
+            lines.append("# HELP http_responses_total Responses by route and status code")
+            lines.append("# TYPE http_responses_total counter")
+            for (method, route, status), value in sorted(self.responses.items()):
+                lines.append(f'http_responses_total{{method="{method}",route="{_escape(route)}",status="{status}"}} {value}')
+            _render_histogram(lines, "db_query_duration_seconds", "SQL statement latency",
+                              {(): self.query_latency}, ())
+            lines.append("# HELP db_slow_queries_total Statements slower than SLOW_QUERY_MS")
+            lines.append("# TYPE db_slow_queries_total counter")
+            lines.append(f"db_slow_queries_total {self.slow_queries}")
+        return "\n".join(lines) + "\n"
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"')
+
+def _render_histogram(lines, name, help_text, histograms, label_names):
+    lines.append(f"# HELP {name} {help_text}")
+    lines.append(f"# TYPE {name} histogram")
+    for labels, histogram in sorted(histograms.items()):
+        base = ",".join(f'{label}="{_escape(str(value))}"' for label, value in zip(label_names, labels))
+        prefix = base + "," if base else ""
+        cumulative = 0
+        for bound, count in zip(histogram.buckets, histogram.counts):
+            cumulative += count
+            lines.append(f'{name}_bucket{{{prefix}le="{bound}"}} {cumulative}')
+        lines.append(f'{name}_bucket{{{prefix}le="+Inf"}} {histogram.count}')
+        suffix = "{" + base + "}" if base else ""
+        lines.append(f"{name}_sum{suffix} {histogram.total}")
+        lines.append(f"{name}_count{suffix} {histogram.count}")
+
+
+registry = Registry()
+
+# Per-request counters; a mutable dict so threadpool copies of the context
+# (sync routes) still update the same object.
+_request_stats: ContextVar = ContextVar("request_stats", default=None)
+
+
+# --- SQL ---
+_WHITESPACE = re.compile(r"\s+")
+_STRING_LITERAL = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_LITERAL = re.compile(r"\b\d+(?:\.\d+)?\b")
+_PARAM_LIST = re.compile(r"\((?:\s*(?:\?|%\([^)]*\)s|%s|:\w+|\$\d+)\s*,)+\s*(?:\?|%\([^)]*\)s|%s|:\w+|\$\d+)\s*\)")
+
+def normalize_sql(statement: str) -> str:
+    statement = _STRING_LITERAL.sub("?", statement)
+    statement = _NUMBER_LITERAL.sub("?", statement)
+    statement = _PARAM_LIST.sub("(...)", statement)
+    return _WHITESPACE.sub(" ", statement).strip()
+
+def install_sql_instrumentation(sync_engine):
+    if not METRICS_ENABLED:
+        return
+
+    @event.listens_for(sync_engine, "before_cursor_execute")
+    def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+    @event.listens_for(sync_engine, "after_cursor_execute")
+    def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        duration = time.perf_counter() - conn.info["query_started"].pop()
+        stats = _request_stats.get()
+        if stats is not None:
+            stats["queries"] += 1
+            stats["sql_time"] += duration
+        slow = duration * 1000 >= SLOW_QUERY_MS
+        registry.observe_query(duration, slow)
+        if slow:
+            logger.warning("slow query %.1fms: %s", duration * 1000, normalize_sql(statement))
+
+
+# --- HTTP ---
+class MetricsMiddleware:
+    """Pure ASGI middleware (no BaseHTTPMiddleware overhead)."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        # Mounted sub-apps see the parent's scope keys: measure only once
+        if scope["type"] != "http" or not METRICS_ENABLED or "metrics.started" in scope:
+            await self.app(scope, receive, send)
+            return
+        started = time.perf_counter()
+        scope["metrics.started"] = started
+        stats = {"queries": 0, "sql_time": 0.0}
+        token = _request_stats.set(stats)
+        status_code = 500
+
+        async def send_wrapper(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            _request_stats.reset(token)
+            route = scope.get("route")
+            route_path = getattr(route, "path_format", None) or getattr(route, "path", None) or "unmatched"
+            registry.observe_request(scope["method"], route_path, status_code,
+                                     time.perf_counter() - started, stats["queries"], stats["sql_time"])
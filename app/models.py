@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Boolean, ForeignKey, DateTime, Float
+from sqlalchemy import Column, Integer, String, Boolean, ForeignKey, DateTime, Float, Index
 from sqlalchemy.orm import relationship
 from datetime import datetime
 from .database import Base
@@ -41,6 +41,11 @@ class Expense(Base):
     owner = relationship("User", back_populates="expenses")
     category = relationship("Category", back_populates="expenses")
 
+    __table_args__ = (
+        Index("ix_expenses_user_date_id", "user_id", "date", "id"),
+        Index("ix_expenses_user_category_date", "user_id", "category_id", "date"),
+    )
+
 class Income(Base):
     __tablename__ = "incomes"
     id = Column(Integer, primary_key=True, index=True)
@@ -53,6 +58,8 @@ class Income(Base):
     owner = relationship("User", back_populates="incomes")
     category = relationship("Category", back_populates="incomes")
 
+    __table_args__ = (Index("ix_incomes_user_date_id", "user_id", "date", "id"),)
+
 class Budget(Base):
     __tablename__ = "budgets"
     id = Column(Integer, primary_key=True, index=True)
@@ -63,4 +70,62 @@ class Budget(Base):
     user_id = Column(Integer, ForeignKey("users.id"))
     category_id = Column(Integer, ForeignKey("categories.id"))
     owner = relationship("User", back_populates="budgets")
-    category = relationship("Category", back_populates="budgets")
\ No newline at end of file
+    category = relationship("Category", back_populates="budgets")
+
+# Running totals maintained by crud on every ledger write
+class UserBalance(Base):
+    __tablename__ = "user_balances"
+    user_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    total_income = Column(Float, default=0, nullable=False)
+    total_expenses = Column(Float, default=0, nullable=False)
+
+class CategoryMonthlyTotal(Base):
+    __tablename__ = "category_monthly_totals"
+    user_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    category_id = Column(Integer, ForeignKey("categories.id"), primary_key=True)
+    month = Column(String(7), primary_key=True)  # "YYYY-MM"
+    total_amount = Column(Float, default=0, nullable=False)
+    expense_count = Column(Integer, default=0, nullable=False)
+
+class UserDataVersion(Base):
+    __tablename__ = "user_data_versions"
+    user_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    version = Column(Integer, default=0, nullable=False)
+
+# Кэштелген токендердің нұсқасы: профиль/құпия сөз өзгергенде не аккаунт
+# өшірілгенде өседі. user_id сыртқы кілт емес және тазалауда өшірілмейді:
+# SQLite id-ді жаңа қолданушыға берсе де нұсқа кері қайтпайды.
+class UserAuthVersion(Base):
+    __tablename__ = "user_auth_versions"
+    user_id = Column(Integer, primary_key=True)
+    version = Column(Integer, default=0, nullable=False)
+
+# Фон режимінде өшірілетін аккаунттардың прогресі. user_id сыртқы кілт емес:
+# қолданушы жолы өшірілгеннен кейін де жазба қалады.
+class AccountDeletion(Base):
+    __tablename__ = "account_deletions"
+    user_id = Column(Integer, primary_key=True)
+    status = Column(String, default="pending", nullable=False)  # pending | running | done
+    stage = Column(String, nullable=True)
+    rows_deleted = Column(Integer, default=0, nullable=False)
+    started_at = Column(DateTime, default=datetime.utcnow)
+    updated_at = Column(DateTime, nullable=True)
+    finished_at = Column(DateTime, nullable=True)
+
+# Transactional outbox: хабарламалар шығынмен бір транзакцияда жазылады,
+# оларды notifications.OutboxDispatcher фонда жібереді.
+class NotificationOutbox(Base):
+    __tablename__ = "notification_outbox"
+    id = Column(Integer, primary_key=True)
+    user_id = Column(Integer, ForeignKey("users.id"), index=True)
+    chat_id = Column(String, nullable=False)
+    text = Column(String, nullable=False)
+    idempotency_key = Column(String, unique=True, nullable=False)
+    status = Column(String, default="pending", nullable=False)  # pending | sending | sent | failed
+    attempts = Column(Integer, default=0, nullable=False)
+    next_attempt_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+    last_error = Column(String, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    sent_at = Column(DateTime, nullable=True)
+
+    __table_args__ = (Index("ix_notification_outbox_status_next", "status", "next_attempt_at"),)
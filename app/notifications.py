@@ -0,0 +1,211 @@
+"""Outbox dispatcher for Telegram notifications.
+
+Rows in notification_outbox are claimed in batches with a lease
+(status='sending', next_attempt_at=now+lease), sent concurrently through a
+pluggable sender and then marked sent, rescheduled with exponential backoff
+or failed. Delivery is at-least-once: a worker that dies between sending
+and marking leaves the row to be re-claimed once its lease expires. The
+unique idempotency_key stops the same event from being queued twice and is
+passed to the sender.
+"""
+import asyncio
+import json
+import logging
+import os
+import random
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import select, update, or_, and_
+from starlette.concurrency import run_in_threadpool
+
+from . import models, database
+
+OUTBOX_BATCH_SIZE = int(os.getenv("OUTBOX_BATCH_SIZE", "50"))
+OUTBOX_POLL_INTERVAL = float(os.getenv("OUTBOX_POLL_INTERVAL", "2"))
+OUTBOX_CONCURRENCY = int(os.getenv("OUTBOX_CONCURRENCY", "10"))
+OUTBOX_CHAT_INTERVAL = float(os.getenv("OUTBOX_CHAT_INTERVAL", "1"))  # Telegram: ~1 хабар/сек бір чатқа
+OUTBOX_MAX_ATTEMPTS = int(os.getenv("OUTBOX_MAX_ATTEMPTS", "8"))
+OUTBOX_BACKOFF_BASE = float(os.getenv("OUTBOX_BACKOFF_BASE", "2"))
+OUTBOX_BACKOFF_MAX = float(os.getenv("OUTBOX_BACKOFF_MAX", "600"))
+OUTBOX_LEASE_SECONDS = float(os.getenv("OUTBOX_LEASE_SECONDS", "60"))
+
+logger = logging.getLogger("app.notifications")
+
+
+class RetryableSendError(Exception):
+    def __init__(self, message: str, retry_after: float = None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class PermanentSendError(Exception):
+    pass
+
+
+# --- SENDERS ---
+class FakeSender:
+    """Records messages instead of sending them; fail_times simulates outages."""
+
+    def __init__(self, fail_times: int = 0):
+        self.sent = []
+        self.fail_times = fail_times
+
+    async def send(self, chat_id: str, text: str, idempotency_key: str):
+        if self.fail_times > 0:
+            self.fail_times -= 1
+            raise RetryableSendError("fake outage")
+        self.sent.append((chat_id, text, idempotency_key))
+        logger.info("fake send to %s: %s", chat_id, text)
+
+    async def close(self):
+        pass
+
+
+class TelegramSender:
+    def __init__(self, token: str, timeout: float = 10):
+        self.url = f"https://api.telegram.org/bot{token}/sendMessage"
+        self.timeout = timeout
+        self._session = None
+
+    async def send(self, chat_id: str, text: str, idempotency_key: str):
+        import aiohttp
+        if self._session is None:
+            self._session = aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=self.timeout))
+        try:
+            async with self._session.post(self.url, json={"chat_id": chat_id, "text": text}) as response:
+                raw = await response.read()
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            raise RetryableSendError(f"network: {e!r}")
+        # Прокси/балансер қателері JSON емес (HTML) болуы мүмкін: статус денеден бұрын шешеді
+        try:
+            body = json.loads(raw)
+        except ValueError:
+            body = None
+        if not isinstance(body, dict):
+            body = {"description": raw[:200].decode("utf-8", "replace")}
+        if response.status == 200 and body.get("ok"):
+            return
+        description = body.get("description", "")
+        if response.status == 429:
+            parameters = body.get("parameters")
+            retry_after = parameters.get("retry_after") if isinstance(parameters, dict) else None
+            if retry_after is None and response.headers.get("Retry-After", "").isdigit():
+                retry_after = int(response.headers["Retry-After"])
+            raise RetryableSendError(f"429: {description}", retry_after=retry_after)
+        if response.status >= 500 or response.status == 200:
+            # 200 бірақ ok жоқ/JSON емес: жауап бүлінген, қайталап көреміз
+            raise RetryableSendError(f"{response.status}: {description}")
+        # 400/403: чат табылмады немесе бот блокталған, қайталаудың мәні жоқ
+        raise PermanentSendError(f"{response.status}: {description}")
+
+    async def close(self):
+        if self._session is not None:
+            await self._session.close()
+
+
+# --- DISPATCHER ---
+class OutboxDispatcher:
+    def __init__(self, sender, session_factory=None, batch_size: int = OUTBOX_BATCH_SIZE,
+                 concurrency: int = OUTBOX_CONCURRENCY, chat_interval: float = OUTBOX_CHAT_INTERVAL,
+                 poll_interval: float = OUTBOX_POLL_INTERVAL, max_attempts: int = OUTBOX_MAX_ATTEMPTS):
+        self.sender = sender
+        self.session_factory = session_factory or database.SessionLocal
+        self.batch_size = batch_size
+        self.concurrency = concurrency
+        self.chat_interval = chat_interval
+        self.poll_interval = poll_interval
+        self.max_attempts = max_attempts
+        self._stopping = asyncio.Event()
+        self._chat_locks = {}
+        self._chat_next_send = {}
+
+    def _claim_batch(self):
+        now = datetime.utcnow()
+        outbox = models.NotificationOutbox
+        due = and_(outbox.next_attempt_at <= now, or_(outbox.status == "pending", outbox.status == "sending"))
+        db = self.session_factory()
+        try:
+            # PostgreSQL: SKIP LOCKED бірнеше процесс бір жолды алмауы үшін; SQLite-та жазушы біреу ғана
+            rows = db.execute(select(outbox.id, outbox.chat_id, outbox.text, outbox.idempotency_key, outbox.attempts)
+                              .where(due).order_by(outbox.id).limit(self.batch_size)
+                              .with_for_update(skip_locked=True)).all()
+            if rows:
+                db.execute(update(outbox).where(outbox.id.in_([row.id for row in rows]), due).values(
+                    status="sending", next_attempt_at=now + timedelta(seconds=OUTBOX_LEASE_SECONDS)))
+            db.commit()
+            return rows
+        finally:
+            db.close()
+
+    def _finish(self, outbox_id: int, **values):
+        db = self.session_factory()
+        try:
+            outbox = models.NotificationOutbox
+            db.execute(update(outbox).where(outbox.id == outbox_id, outbox.status == "sending").values(**values))
+            db.commit()
+        finally:
+            db.close()
+
+    def _backoff(self, attempts: int, retry_after: float = None) -> float:
+        if retry_after:
+            return float(retry_after)
+        return min(OUTBOX_BACKOFF_MAX, OUTBOX_BACKOFF_BASE ** attempts) * random.uniform(0.8, 1.2)
+
+    async def _wait_for_chat_slot(self, chat_id: str):
+        delay = self._chat_next_send.get(chat_id, 0) - time.monotonic()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        self._chat_next_send[chat_id] = time.monotonic() + self.chat_interval
+
+    async def _deliver(self, row, slots: asyncio.Semaphore):
+        # Бір чатқа жіберулер кезекпен жүреді және chat_interval-мен шектеледі
+        lock = self._chat_locks.setdefault(row.chat_id, asyncio.Lock())
+        async with lock:
+            await self._wait_for_chat_slot(row.chat_id)
+            async with slots:
+                try:
+                    await self.sender.send(row.chat_id, row.text, row.idempotency_key)
+                except RetryableSendError as e:
+                    attempts = row.attempts + 1
+                    if attempts >= self.max_attempts:
+                        values = {"status": "failed", "attempts": attempts, "last_error": str(e)}
+                    else:
+                        values = {"status": "pending", "attempts": attempts, "last_error": str(e),
+                                  "next_attempt_at": datetime.utcnow() + timedelta(seconds=self._backoff(attempts, e.retry_after))}
+                        if e.retry_after:
+                            self._chat_next_send[row.chat_id] = time.monotonic() + float(e.retry_after)
+                except Exception as e:
+                    logger.warning("outbox %s failed permanently: %r", row.id, e)
+                    values = {"status": "failed", "attempts": row.attempts + 1, "last_error": str(e)}
+                else:
+                    values = {"status": "sent", "attempts": row.attempts + 1, "sent_at": datetime.utcnow(), "last_error": None}
+        await run_in_threadpool(self._finish, row.id, **values)
+
+    async def drain_once(self) -> int:
+        rows = await run_in_threadpool(self._claim_batch)
+        if rows:
+            slots = asyncio.Semaphore(self.concurrency)
+            await asyncio.gather(*(self._deliver(row, slots) for row in rows))
+            now = time.monotonic()
+            for chat_id in [chat_id for chat_id, lock in self._chat_locks.items() if not lock.locked()]:
+                del self._chat_locks[chat_id]
+            for chat_id in [chat_id for chat_id, next_send in self._chat_next_send.items() if next_send <= now]:
+                del self._chat_next_send[chat_id]
+        return len(rows)
+
+    async def run(self):
+        while not self._stopping.is_set():
+            try:
+                claimed = await self.drain_once()
+            except Exception:
+                logger.exception("outbox dispatcher iteration failed")
+                claimed = 0
+            if claimed < self.batch_size:
+                try:
+                    await asyncio.wait_for(self._stopping.wait(), timeout=self.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+
+    def stop(self):
+        self._stopping.set()
@@ -0,0 +1,48 @@
+"""Rebuild or verify the per-user rollup tables.
+
+    python -m app.rollups              # recompute rollups for every user
+    python -m app.rollups --check      # report drift only, exit 1 if any
+    python -m app.rollups --user-id 7  # limit to one user
+"""
+import argparse
+import sys
+
+from . import models, database, crud
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Rebuild or check balance/category rollups")
+    parser.add_argument("--check", action="store_true", help="only report drift, do not rewrite")
+    parser.add_argument("--user-id", type=int, help="process a single user")
+    args = parser.parse_args(argv)
+
+    database.Base.metadata.create_all(bind=database.engine)
+    # --check only reads: on SQLite a SessionLocal transaction would hold the write lock for the whole scan
+    db = database.ReadSessionLocal() if args.check else database.SessionLocal()
+    drifted = 0
+    try:
+        query = db.query(models.User.id).order_by(models.User.id)
+        if args.user_id is not None:
+            query = query.filter(models.User.id == args.user_id)
+        user_ids = [user_id for (user_id,) in query.all()]
+        db.rollback()
+        for user_id in user_ids:
+            drift = crud.check_user_rollups(db, user_id)
+            if drift:
+                drifted += 1
+                for line in drift:
+                    print(f"user {user_id}: {line}")
+            if not args.check:
+                crud.rebuild_user_rollups(db, user_id)
+                db.commit()
+            else:
+                # One short transaction per user, so writers are never blocked for the whole run
+                db.rollback()
+    finally:
+        db.close()
+    print(f"{drifted} user(s) with drift" + ("" if args.check else ", rollups rebuilt"))
+    return 1 if args.check and drifted else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
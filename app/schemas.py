@@ -1,4 +1,4 @@
-from pydantic import BaseModel, EmailStr, Field 
+from pydantic import BaseModel, EmailStr, Field, model_validator
 from typing import Optional, List
 from datetime import date as DateType  
 
@@ -85,6 +85,21 @@ class BudgetResponse(BudgetBase):
     class Config:
         from_attributes = True
 
+class BudgetStatus(BudgetResponse):
+    spent: float
+    remaining: float
+    percent_used: float
+
+class BudgetAlert(BaseModel):
+    budget_id: int
+    category_id: int
+    threshold: int
+    limit_amount: float
+    spent: float
+
+class ExpenseCreateResponse(ExpenseResponse):
+    budget_alerts: List[BudgetAlert] = []
+
 # ----------------------------------------------------
 # 6. EXPENSE UPDATE
 # ----------------------------------------------------
@@ -94,6 +109,26 @@ class ExpenseUpdate(BaseModel):
     category_id: Optional[int] = None
     date: Optional[DateType] = None 
 
+    # Тек description-ды null арқылы тазалауға болады; қалған бағандар бос бола алмайды
+    @model_validator(mode="after")
+    def _reject_nulls(self):
+        for name in ("amount", "category_id", "date"):
+            if name in self.model_fields_set and getattr(self, name) is None:
+                raise ValueError(f"{name} cannot be null")
+        return self
+
+class ExpenseSelection(BaseModel):
+    ids: Optional[List[int]] = Field(None, max_length=10000)
+    category_id: Optional[int] = None
+    date_from: Optional[DateType] = None
+    date_to: Optional[DateType] = None
+
+class ExpenseBatchUpdate(ExpenseSelection):
+    changes: ExpenseUpdate
+
+class BatchResult(BaseModel):
+    affected: int
+
 # ----------------------------------------------------
 # 7. BALANCE & STATS
 # ----------------------------------------------------
@@ -106,5 +141,36 @@ class CategoryStats(BaseModel):
     category_name: str
     total_amount: float
 
+class TimeseriesPoint(BaseModel):
+    period: DateType
+    type: str
+    category_name: Optional[str] = None
+    total_amount: float
+
 class TelegramLink(BaseModel):
-    telegram_chat_id: str
\ No newline at end of file
+    telegram_chat_id: str
+
+# ----------------------------------------------------
+# 8. BULK IMPORT
+# ----------------------------------------------------
+class BulkRowError(BaseModel):
+    row: int
+    field: str
+    message: str
+
+class BulkInsertResult(BaseModel):
+    inserted_ids: List[int]
+    errors: List[BulkRowError]
+
+# ----------------------------------------------------
+# 9. SEARCH (Іздеу)
+# ----------------------------------------------------
+class SearchResult(BaseModel):
+    type: str
+    id: int
+    date: DateType
+    amount: float
+    category_id: Optional[int] = None
+    category_name: Optional[str] = None
+    description: Optional[str] = None
+    rank: float
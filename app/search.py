@@ -0,0 +1,60 @@
+"""Full-text indexes over expense/income descriptions.
+
+SQLite: a contentless FTS5 table per ledger table, kept in sync by triggers.
+Besides the description it indexes a per-user token ('u<user_id>'), so a
+search intersects the user's own doclist instead of ranking every user's
+matches; prefix indexes keep short 'term*' queries cheap.
+
+PostgreSQL: a GIN index on the same to_tsvector expression that
+crud.search_user_ledger matches against, so no extra column is needed.
+The 'simple' configuration is used because descriptions mix Kazakh, Russian
+and English and no single stemmer fits all three.
+"""
+from sqlalchemy import text
+
+SEARCH_TABLES = ("expenses", "incomes")
+TS_CONFIG = "simple"
+
+
+def tsvector_sql(table: str) -> str:
+    # Must stay identical to the indexed expression for the planner to use it
+    return f"to_tsvector('{TS_CONFIG}', coalesce({table}.description, ''))"
+
+
+def user_token(user_id: int) -> str:
+    return f"u{int(user_id)}"
+
+
+def _sqlite_ddl(table: str):
+    fts = f"{table}_fts"
+    # Contentless: 'delete' must be given exactly the values that were indexed
+    row = "{0}.id, {0}.description, 'u' || {0}.user_id"
+    return [
+        f"CREATE VIRTUAL TABLE IF NOT EXISTS {fts} USING fts5("
+        f"description, user_tok, content='', prefix='2 3', tokenize='unicode61 remove_diacritics 2')",
+        f"CREATE TRIGGER IF NOT EXISTS {table}_fts_ai AFTER INSERT ON {table} BEGIN "
+        f"INSERT INTO {fts}(rowid, description, user_tok) VALUES ({row.format('new')}); END",
+        f"CREATE TRIGGER IF NOT EXISTS {table}_fts_ad AFTER DELETE ON {table} BEGIN "
+        f"INSERT INTO {fts}({fts}, rowid, description, user_tok) VALUES ('delete', {row.format('old')}); END",
+        f"CREATE TRIGGER IF NOT EXISTS {table}_fts_au AFTER UPDATE OF description, user_id ON {table} BEGIN "
+        f"INSERT INTO {fts}({fts}, rowid, description, user_tok) VALUES ('delete', {row.format('old')}); "
+        f"INSERT INTO {fts}(rowid, description, user_tok) VALUES ({row.format('new')}); END",
+    ]
+
+
+def install_search_index(engine):
+    with engine.begin() as conn:
+        if engine.dialect.name == "sqlite":
+            for table in SEARCH_TABLES:
+                fts = f"{table}_fts"
+                existing = conn.execute(text("SELECT 1 FROM sqlite_master WHERE name = :name"), {"name": fts}).scalar()
+                for statement in _sqlite_ddl(table):
+                    conn.execute(text(statement))
+                if existing is None:
+                    # Бар жолдарды бір рет индекстейміз, кейін триггерлер жаңартады
+                    conn.execute(text(f"INSERT INTO {fts}(rowid, description, user_tok) "
+                                      f"SELECT id, description, 'u' || user_id FROM {table}"))
+        elif engine.dialect.name == "postgresql":
+            for table in SEARCH_TABLES:
+                conn.execute(text(
+                    f"CREATE INDEX IF NOT EXISTS ix_{table}_description_fts ON {table} USING gin ({tsvector_sql(table)})"))
@@ -0,0 +1,52 @@
+import json
+from datetime import date, datetime
+from typing import Union, get_args, get_origin
+
+# Same settings FastAPI's JSONResponse renders with, so output is byte-identical
+_encode = json.JSONEncoder(ensure_ascii=False, allow_nan=False, separators=(",", ":")).encode
+
+
+def _to_date(value):
+    if isinstance(value, datetime):
+        return value.date().isoformat()
+    return value.isoformat() if value is not None else None
+
+
+def _to_float(value):
+    return float(value) if value is not None else None
+
+
+def _converter(annotation):
+    if get_origin(annotation) is Union:
+        annotation = next(arg for arg in get_args(annotation) if arg is not type(None))
+    if annotation is date:
+        return _to_date
+    if annotation is float:
+        return _to_float
+    return None
+
+
+def response_fields(schema):
+    """Field names of a response schema, in the order pydantic serializes them."""
+    return tuple(schema.model_fields)
+
+
+def make_list_encoder(schema):
+    """Build an encoder turning column tuples (in response_fields order) into JSON bytes.
+
+    Bypasses ORM hydration and pydantic validation for large list responses.
+    """
+    names = response_fields(schema)
+    converters = [(index, conv) for index, name in enumerate(names)
+                  if (conv := _converter(schema.model_fields[name].annotation)) is not None]
+
+    def encode(rows) -> bytes:
+        items = []
+        for row in rows:
+            values = list(row)
+            for index, conv in converters:
+                values[index] = conv(values[index])
+            items.append(dict(zip(names, values)))
+        return _encode(items).encode("utf-8")
+
+    return encode
@@ -1,14 +1,58 @@
+import asyncio
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from passlib.context import CryptContext
 
 
+# Хэш құны конфигурацияда; сақталған хэштің құны ескі болса, кіру сәтті
+# өткенде ол жаңа құнмен қайта хэштеледі (verify_and_update_password_async).
+PASSWORD_HASH_ROUNDS = int(os.getenv("PASSWORD_HASH_ROUNDS", "29000"))
+
 pwd_context = CryptContext(
     schemes=["pbkdf2_sha256"], 
     default="pbkdf2_sha256", 
-    pbkdf2_sha256__rounds=1000
+    pbkdf2_sha256__rounds=PASSWORD_HASH_ROUNDS
 )
 
 def get_password_hash(password: str) -> str:
     return pwd_context.hash(password)
 
 def verify_password(plain_password, hashed_password):
-    return pwd_context.verify(plain_password, hashed_password)
\ No newline at end of file
+    return pwd_context.verify(plain_password, hashed_password)
+
+
+# --- ХЭШТЕУ ПУЛЫ ---
+# pbkdf2 (hashlib) GIL-ді босатады, сондықтан бөлек ағындар пулы жеткілікті.
+# Кезек шектеулі: пул толы болса, сұраным күтпей бірден PasswordHasherBusy алады.
+PASSWORD_POOL_WORKERS = int(os.getenv("PASSWORD_POOL_WORKERS", str(min(4, os.cpu_count() or 1))))
+PASSWORD_POOL_MAX_PENDING = int(os.getenv("PASSWORD_POOL_MAX_PENDING", str(PASSWORD_POOL_WORKERS * 8)))
+
+_password_pool = ThreadPoolExecutor(max_workers=PASSWORD_POOL_WORKERS, thread_name_prefix="password-hash")
+_password_slots = threading.BoundedSemaphore(PASSWORD_POOL_MAX_PENDING)
+
+
+class PasswordHasherBusy(Exception):
+    """Raised when the hashing pool queue is full."""
+
+
+async def _run_in_password_pool(fn, *args):
+    if not _password_slots.acquire(blocking=False):
+        raise PasswordHasherBusy()
+    try:
+        future = _password_pool.submit(fn, *args)
+    except BaseException:
+        _password_slots.release()
+        raise
+    future.add_done_callback(lambda _: _password_slots.release())
+    return await asyncio.wrap_future(future)
+
+async def get_password_hash_async(password: str) -> str:
+    return await _run_in_password_pool(pwd_context.hash, password)
+
+async def verify_password_async(plain_password, hashed_password) -> bool:
+    return await _run_in_password_pool(pwd_context.verify, plain_password, hashed_password)
+
+async def verify_and_update_password_async(plain_password, hashed_password):
+    # (дұрыс па, жаңа хэш немесе None) — хэш құны ескірген болса жаңасы қайтарылады
+    return await _run_in_password_pool(pwd_context.verify_and_update, plain_password, hashed_password)
@@ -0,0 +1,81 @@
+"""Login throughput at several password-hash cost settings.
+
+    python benchmarks/bench_login.py [--rounds 1000 29000 100000] [--requests 200] [--concurrency 16]
+
+Each cost setting runs in a fresh subprocess (PASSWORD_HASH_ROUNDS is read at
+import time) against the in-process app on a throwaway SQLite database, so
+the numbers include routing, the user lookup and the hashing pool. Only
+successful logins count towards logins/s; 503s are requests shed by the pool.
+"""
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+async def run_child(requests, concurrency):
+    sys.path.insert(0, ROOT)
+    import httpx
+    from app.main import app
+    from app import utils
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        await client.post("/users/", json={"email": "bench@example.com", "username": "bench", "password": "benchpass"})
+        semaphore = asyncio.Semaphore(concurrency)
+        latencies, statuses = [], {}
+
+        async def one():
+            async with semaphore:
+                started = time.perf_counter()
+                r = await client.post("/token", data={"username": "bench@example.com", "password": "benchpass"})
+                latencies.append(time.perf_counter() - started)
+                statuses[r.status_code] = statuses.get(r.status_code, 0) + 1
+
+        started = time.perf_counter()
+        await asyncio.gather(*(one() for _ in range(requests)))
+        elapsed = time.perf_counter() - started
+    latencies.sort()
+    print(json.dumps({
+        "rounds": utils.PASSWORD_HASH_ROUNDS,
+        "workers": utils.PASSWORD_POOL_WORKERS,
+        "logins_per_sec": statuses.get(200, 0) / elapsed,
+        "p50_ms": latencies[len(latencies) // 2] * 1000,
+        "p95_ms": latencies[int(len(latencies) * 0.95) - 1] * 1000,
+        "statuses": statuses,
+    }))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rounds", type=int, nargs="+", default=[1000, 29000, 100000])
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        asyncio.run(run_child(args.requests, args.concurrency))
+        return
+
+    print(f"{'rounds':>8} {'workers':>8} {'logins/s':>10} {'p50':>9} {'p95':>9}  statuses")
+    for rounds in args.rounds:
+        with tempfile.TemporaryDirectory() as tmp:
+            env = dict(os.environ, PASSWORD_HASH_ROUNDS=str(rounds), DATABASE_URL=f"sqlite:///{tmp}/bench.db")
+            out = subprocess.run(
+                [sys.executable, __file__, "--child", "--requests", str(args.requests), "--concurrency", str(args.concurrency)],
+                env=env, capture_output=True, text=True, check=True,
+            ).stdout
+        result = json.loads(out.strip().splitlines()[-1])
+        print(f"{result['rounds']:>8} {result['workers']:>8} {result['logins_per_sec']:>10.1f} "
+              f"{result['p50_ms']:>7.1f}ms {result['p95_ms']:>7.1f}ms  {result['statuses']}")
+
+
+if __name__ == "__main__":
+    main()
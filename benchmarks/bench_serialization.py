@@ -0,0 +1,90 @@
+"""Compare the ORM + pydantic list path with the column-tuple fast path.
+
+    python benchmarks/bench_serialization.py [--sizes 1000 10000 100000] [--repeat 3]
+
+Each size is seeded into an in-memory SQLite database and both paths are
+timed end to end (query + validation + JSON bytes). The outputs are checked
+to be byte-identical.
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from datetime import datetime, timedelta
+from typing import List
+
+os.environ.setdefault("DATABASE_URL", "sqlite://")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from pydantic import TypeAdapter
+from sqlalchemy import create_engine, insert
+from sqlalchemy.orm import sessionmaker
+
+from app import models, schemas, crud, serializers
+from app.database import Base
+
+adapter = TypeAdapter(List[schemas.ExpenseResponse])
+encode_expenses = serializers.make_list_encoder(schemas.ExpenseResponse)
+
+
+def slow_path(db, user_id, limit):
+    # What FastAPI does for response_model=List[ExpenseResponse]
+    db.expunge_all()
+    items, _ = crud.get_user_expenses_page(db, user_id, limit=limit)
+    content = adapter.dump_python(adapter.validate_python(items, from_attributes=True), mode="json")
+    return json.dumps(content, ensure_ascii=False, allow_nan=False, indent=None, separators=(",", ":")).encode("utf-8")
+
+
+def fast_path(db, user_id, limit):
+    items, _ = crud.get_user_expense_rows_page(db, user_id, limit=limit)
+    return encode_expenses(items)
+
+
+def seed(db, size):
+    user = models.User(email="bench@example.com", username="bench", hashed_password="x")
+    db.add(user)
+    db.flush()
+    category = models.Category(name="bench", user_id=user.id)
+    db.add(category)
+    db.flush()
+    start = datetime(2020, 1, 1)
+    db.execute(insert(models.Expense), [
+        {"amount": round(1 + i * 0.37 % 500, 2), "description": f"expense {i}" if i % 3 else None,
+         "category_id": category.id, "date": start + timedelta(days=i % 1500), "user_id": user.id}
+        for i in range(size)])
+    db.commit()
+    return user.id
+
+
+def best_of(fn, repeat):
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = fn()
+        timings.append(time.perf_counter() - started)
+    return min(timings), result
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    print(f"{'rows':>8} {'orm+pydantic':>14} {'fast path':>12} {'speedup':>8}")
+    for size in args.sizes:
+        engine = create_engine("sqlite://")
+        Base.metadata.create_all(bind=engine)
+        db = sessionmaker(bind=engine)()
+        user_id = seed(db, size)
+        slow_time, slow_body = best_of(lambda: slow_path(db, user_id, size), args.repeat)
+        fast_time, fast_body = best_of(lambda: fast_path(db, user_id, size), args.repeat)
+        assert slow_body == fast_body, "fast path output differs from the schema path"
+        print(f"{size:>8} {slow_time * 1000:>12.1f}ms {fast_time * 1000:>10.1f}ms {slow_time / fast_time:>7.1f}x")
+        db.close()
+        engine.dispose()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,279 @@
+"""Drive every API route at a fixed concurrency and report latency percentiles.
+
+    python benchmarks/seed.py --database bench.db
+    python benchmarks/load_test.py --database bench.db --output run.json
+    python benchmarks/load_test.py --database bench.db --compare run.json
+
+By default the app is imported and called in-process through httpx's ASGI
+transport (set --async-app to use app.async_main). Pass --url to hit a running
+server instead, e.g. ``uvicorn app.main:app`` started against the same
+database. Each endpoint gets --requests requests spread over seeded users at
+--concurrency; p50/p95/p99 latency, throughput and error counts are printed and
+can be saved as JSON. --compare flags endpoints whose p95 or throughput
+regressed by more than --threshold against an earlier run (exit code 1).
+
+Account routes (signup, profile, password, Telegram, deletion) are left out.
+PATCH, batch and DELETE scenarios only touch expenses the run itself created,
+so the seeded rows stay comparable between runs. A route the target does not
+serve shows up as 404 errors rather than being skipped.
+"""
+import argparse
+import asyncio
+import contextlib
+import json
+import os
+import platform
+import random
+import sys
+import time
+from datetime import date, datetime, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PASSWORD = "benchpass"
+BULK_ROWS = 50  # rows per POST /expenses/bulk request
+BATCH_IDS = 20  # ids per batch-update/batch-delete request
+
+
+def _percentile(sorted_values, fraction):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, int(round(fraction * len(sorted_values))) - 1))
+    return sorted_values[index]
+
+
+class Session:
+    """A logged-in seeded user plus what the scenarios need to know about them."""
+
+    def __init__(self, email, headers, category_ids):
+        self.email = email
+        self.headers = headers
+        self.category_ids = category_ids
+        self.created_expenses = []
+
+
+def _build_scenarios(rng):
+    today = date(2022, 12, 31)
+
+    def expense_body(session):
+        return {"amount": round(rng.uniform(1, 200), 2), "category_id": rng.choice(session.category_ids),
+                "date": (today - timedelta(days=rng.randrange(365))).isoformat(), "description": "load test"}
+
+    async def token(client, session):
+        return await client.post("/token", data={"username": session.email, "password": PASSWORD})
+
+    async def create_expense(client, session):
+        r = await client.post("/expenses/", json=expense_body(session), headers=session.headers)
+        if r.status_code == 200:
+            session.created_expenses.append(r.json()["id"])
+        return r
+
+    async def bulk_expenses(client, session):
+        rows = [expense_body(session) for _ in range(BULK_ROWS)]
+        r = await client.post("/expenses/bulk", json=rows, headers=session.headers)
+        if r.status_code == 200:
+            session.created_expenses.extend(r.json()["inserted_ids"])
+        return r
+
+    async def patch_expense(client, session):
+        expense_id = rng.choice(session.created_expenses) if session.created_expenses else 0
+        return await client.patch(f"/expenses/{expense_id}", json={"amount": round(rng.uniform(1, 200), 2)},
+                                  headers=session.headers)
+
+    async def batch_update(client, session):
+        ids = rng.sample(session.created_expenses, min(BATCH_IDS, len(session.created_expenses)))
+        return await client.post("/expenses/batch-update", json={"ids": ids, "changes": {"description": "load test batch"}},
+                                 headers=session.headers)
+
+    async def batch_delete(client, session):
+        ids = [session.created_expenses.pop() for _ in range(min(BATCH_IDS, len(session.created_expenses)))]
+        return await client.post("/expenses/batch-delete", json={"ids": ids}, headers=session.headers)
+
+    async def delete_expense(client, session):
+        expense_id = session.created_expenses.pop() if session.created_expenses else 0
+        return await client.delete(f"/expenses/{expense_id}", headers=session.headers)
+
+    async def create_income(client, session):
+        return await client.post("/incomes/", json={
+            "amount": round(rng.uniform(100, 5000), 2), "description": "load test",
+            "date": (today - timedelta(days=rng.randrange(365))).isoformat()}, headers=session.headers)
+
+    async def create_category(client, session):
+        return await client.post("/categories/", json={"name": f"load test {rng.randrange(10 ** 6)}"},
+                                 headers=session.headers)
+
+    async def create_budget(client, session):
+        start = today - timedelta(days=rng.randrange(365))
+        return await client.post("/budgets/", json={
+            "limit_amount": round(rng.uniform(100, 2000), 2), "category_id": rng.choice(session.category_ids),
+            "start_date": start.isoformat(), "end_date": (start + timedelta(days=30)).isoformat()}, headers=session.headers)
+
+    def get(path, params=None):
+        async def run(client, session):
+            return await client.get(path, params=params, headers=session.headers)
+        return run
+
+    return {
+        "POST /token": token,
+        "GET /users/me/": get("/users/me/"),
+        "GET /categories/": get("/categories/"),
+        "GET /expenses/": get("/expenses/"),
+        "GET /expenses/ filtered": get("/expenses/", {"date_from": "2022-01-01", "date_to": "2022-03-31", "limit": 50}),
+        "GET /incomes/": get("/incomes/"),
+        "GET /balance/": get("/balance/"),
+        "GET /statistics/expenses/": get("/statistics/expenses/"),
+        "GET /statistics/timeseries/": get("/statistics/timeseries/", {"bucket": "month", "by_category": "true"}),
+        "GET /search/": get("/search/", {"q": "taxi"}),
+        "GET /search/ prefix": get("/search/", {"q": "gro", "date_from": "2022-06-01"}),
+        "GET /export/ csv": get("/export/", {"format": "csv"}),
+        "GET /budgets/": get("/budgets/"),
+        "GET /budgets/status/": get("/budgets/status/"),
+        "POST /expenses/": create_expense,
+        "POST /expenses/bulk": bulk_expenses,
+        "PATCH /expenses/{id}": patch_expense,
+        "POST /expenses/batch-update": batch_update,
+        "POST /expenses/batch-delete": batch_delete,
+        "DELETE /expenses/{id}": delete_expense,
+        "POST /incomes/": create_income,
+        "POST /categories/": create_category,
+        "POST /budgets/": create_budget,
+    }
+
+
+async def _run_endpoint(client, scenario, sessions, requests, concurrency):
+    latencies, statuses = [], {}
+    queue = asyncio.Queue()
+    for i in range(requests):
+        queue.put_nowait(sessions[i % len(sessions)])
+
+    async def worker():
+        while True:
+            try:
+                session = queue.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+            started = time.perf_counter()
+            try:
+                response = await scenario(client, session)
+                status = response.status_code
+            except Exception as exc:
+                status = type(exc).__name__
+            latencies.append(time.perf_counter() - started)
+            statuses[str(status)] = statuses.get(str(status), 0) + 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    latencies.sort()
+    errors = sum(count for status, count in statuses.items() if not status.startswith("2"))
+    return {
+        "requests": requests,
+        "errors": errors,
+        "statuses": statuses,
+        "throughput_rps": requests / elapsed if elapsed else 0.0,
+        "p50_ms": _percentile(latencies, 0.50) * 1000,
+        "p95_ms": _percentile(latencies, 0.95) * 1000,
+        "p99_ms": _percentile(latencies, 0.99) * 1000,
+        "max_ms": (latencies[-1] if latencies else 0.0) * 1000,
+    }
+
+
+async def run(args):
+    import httpx
+
+    lifespan = contextlib.nullcontext()
+    if args.url:
+        client = httpx.AsyncClient(base_url=args.url, timeout=60)
+    else:
+        os.environ["DATABASE_URL"] = f"sqlite:///{os.path.abspath(args.database)}"
+        sys.path.insert(0, ROOT)
+        if args.async_app:
+            from app.async_main import app
+        else:
+            from app.main import app
+        client = httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench", timeout=60)
+        # ASGITransport sends no lifespan events; run them so startup work happens and engines are disposed
+        lifespan = app.router.lifespan_context(app)
+
+    rng = random.Random(args.seed)
+    async with lifespan, client:
+        sessions = []
+        for user_number in range(1, args.users + 1):
+            email = f"bench{user_number}@example.com"
+            r = await client.post("/token", data={"username": email, "password": PASSWORD})
+            if r.status_code != 200:
+                continue
+            headers = {"Authorization": f"Bearer {r.json()['access_token']}"}
+            categories = (await client.get("/categories/", headers=headers)).json()
+            if categories:
+                sessions.append(Session(email, headers, [c["id"] for c in categories]))
+        if not sessions:
+            raise SystemExit("no seeded users could log in; run benchmarks/seed.py first")
+
+        scenarios = _build_scenarios(rng)
+        selected = [name for name in scenarios if not args.only or any(part in name for part in args.only)]
+        results = {}
+        for name in selected:
+            results[name] = await _run_endpoint(client, scenarios[name], sessions, args.requests, args.concurrency)
+            r = results[name]
+            print(f"{name:<30} {r['throughput_rps']:>9.1f} req/s  p50 {r['p50_ms']:>8.1f}ms  "
+                  f"p95 {r['p95_ms']:>8.1f}ms  p99 {r['p99_ms']:>8.1f}ms  errors {r['errors']}")
+    return {
+        "meta": {
+            "started_at": datetime.utcnow().isoformat() + "Z",
+            "target": args.url or ("in-process async" if args.async_app else "in-process sync"),
+            "database": args.database,
+            "users": len(sessions),
+            "requests": args.requests,
+            "concurrency": args.concurrency,
+            "python": platform.python_version(),
+            "env": {key: value for key, value in os.environ.items()
+                    if key.startswith(("DB_", "SQLITE_", "FAST_", "PASSWORD_", "PRINCIPAL_", "METRICS_"))},
+        },
+        "endpoints": results,
+    }
+
+
+def compare(current, baseline, threshold):
+    regressions = []
+    for name, result in current["endpoints"].items():
+        previous = baseline.get("endpoints", {}).get(name)
+        if not previous:
+            continue
+        if previous["p95_ms"] and result["p95_ms"] > previous["p95_ms"] * (1 + threshold):
+            regressions.append(f"{name}: p95 {previous['p95_ms']:.1f}ms -> {result['p95_ms']:.1f}ms")
+        if result["throughput_rps"] < previous["throughput_rps"] * (1 - threshold):
+            regressions.append(f"{name}: throughput {previous['throughput_rps']:.1f} -> {result['throughput_rps']:.1f} req/s")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--database", default="bench.db", help="seeded SQLite file (in-process mode)")
+    parser.add_argument("--url", help="base URL of a running server instead of in-process")
+    parser.add_argument("--async-app", action="store_true", help="use app.async_main in-process")
+    parser.add_argument("--users", type=int, default=20, help="seeded users to log in as")
+    parser.add_argument("--requests", type=int, default=200, help="requests per endpoint")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--only", nargs="*", help="run only endpoints whose name contains one of these")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", help="write results JSON here")
+    parser.add_argument("--compare", help="baseline results JSON to check for regressions")
+    parser.add_argument("--threshold", type=float, default=0.2, help="allowed relative regression (0.2 = 20%%)")
+    args = parser.parse_args()
+
+    results = asyncio.run(run(args))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(results, json.load(f), args.threshold)
+        for line in regressions:
+            print(f"REGRESSION {line}")
+        if regressions:
+            sys.exit(1)
+        print("no regressions")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,125 @@
+"""Seed a local SQLite database with synthetic users and ledger data.
+
+    python benchmarks/seed.py --database bench.db --users 100 --expenses 1000000 --incomes 100000
+
+Every user gets the password ``benchpass`` (see load_test.py). Rows are written
+with batched multi-row INSERTs and the balance/category rollups are rebuilt at
+the end, so the database is immediately usable by the app. Runs are
+reproducible for a given --seed.
+"""
+import argparse
+import os
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+PASSWORD = "benchpass"
+CATEGORY_NAMES = ["Food", "Transport", "Rent", "Utilities", "Health", "Entertainment", "Shopping",
+                  "Education", "Travel", "Gifts", "Salary", "Freelance"]
+DESCRIPTIONS = ["taxi ride", "groceries", "coffee", "monthly rent", "electricity bill", "pharmacy",
+                "cinema", "new shoes", "online course", "flight ticket", "birthday gift", None]
+
+
+def _batched_insert(db, table, rows, batch_size):
+    from sqlalchemy import insert
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= batch_size:
+            db.execute(insert(table), batch)
+            batch = []
+    if batch:
+        db.execute(insert(table), batch)
+
+
+def _spread(total, users):
+    base, extra = divmod(total, users)
+    return [base + (1 if i < extra else 0) for i in range(users)]
+
+
+def seed(args):
+    from app import models, crud, database, utils
+
+    rng = random.Random(args.seed)
+    database.Base.metadata.create_all(bind=database.engine)
+    db = database.SessionLocal()
+    hashed_password = utils.get_password_hash(PASSWORD)
+    start = datetime(2020, 1, 1)
+    span_days = args.days
+
+    first_user = (db.query(models.User.id).order_by(models.User.id.desc()).limit(1).scalar() or 0) + 1
+    user_rows = [{"email": f"bench{first_user + i}@example.com", "username": f"bench{first_user + i}",
+                  "hashed_password": hashed_password, "is_active": True} for i in range(args.users)]
+    _batched_insert(db, models.User.__table__, user_rows, args.batch_size)
+    db.commit()
+    user_ids = [row.id for row in db.query(models.User.id).filter(
+        models.User.email.in_([row["email"] for row in user_rows])).order_by(models.User.id)]
+
+    category_rows = [{"name": CATEGORY_NAMES[c % len(CATEGORY_NAMES)], "user_id": user_id}
+                     for user_id in user_ids for c in range(args.categories)]
+    _batched_insert(db, models.Category.__table__, category_rows, args.batch_size)
+    db.commit()
+    categories = {}
+    for category_id, user_id in db.query(models.Category.id, models.Category.user_id).filter(models.Category.user_id.in_(user_ids)):
+        categories.setdefault(user_id, []).append(category_id)
+
+    budget_rows = []
+    for user_id in user_ids:
+        for category_id in rng.sample(categories[user_id], min(args.budgets, len(categories[user_id]))):
+            month = start + timedelta(days=rng.randrange(span_days))
+            budget_start = month.replace(day=1)
+            budget_rows.append({"user_id": user_id, "category_id": category_id, "limit_amount": rng.choice([100, 250, 500, 1000]),
+                                "start_date": budget_start, "end_date": budget_start + timedelta(days=30)})
+    _batched_insert(db, models.Budget.__table__, budget_rows, args.batch_size)
+
+    def ledger_rows(counts, nullable_category):
+        for user_id, count in zip(user_ids, counts):
+            user_categories = categories[user_id]
+            for _ in range(count):
+                category_id = rng.choice(user_categories)
+                if nullable_category and rng.random() < 0.3:
+                    category_id = None
+                yield {"user_id": user_id, "category_id": category_id,
+                       "amount": round(rng.lognormvariate(3, 1), 2),
+                       "description": rng.choice(DESCRIPTIONS),
+                       "date": start + timedelta(days=rng.randrange(span_days))}
+
+    started = time.perf_counter()
+    _batched_insert(db, models.Expense.__table__, ledger_rows(_spread(args.expenses, len(user_ids)), False), args.batch_size)
+    _batched_insert(db, models.Income.__table__, ledger_rows(_spread(args.incomes, len(user_ids)), True), args.batch_size)
+    db.commit()
+    inserted = time.perf_counter() - started
+
+    for user_id in user_ids:
+        crud.rebuild_user_rollups(db, user_id)
+    db.commit()
+    db.close()
+    print(f"seeded {len(user_ids)} users, {len(category_rows)} categories, {len(budget_rows)} budgets, "
+          f"{args.expenses} expenses, {args.incomes} incomes "
+          f"({(args.expenses + args.incomes) / max(inserted, 1e-9):,.0f} ledger rows/s)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--database", default="bench.db", help="SQLite file to create or extend")
+    parser.add_argument("--users", type=int, default=100)
+    parser.add_argument("--categories", type=int, default=8, help="categories per user")
+    parser.add_argument("--budgets", type=int, default=3, help="budgets per user")
+    parser.add_argument("--expenses", type=int, default=100000, help="expenses in total")
+    parser.add_argument("--incomes", type=int, default=10000, help="incomes in total")
+    parser.add_argument("--days", type=int, default=3 * 365, help="date range the rows are spread over")
+    parser.add_argument("--batch-size", type=int, default=5000)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    # app.database reads DATABASE_URL at import time
+    os.environ["DATABASE_URL"] = f"sqlite:///{os.path.abspath(args.database)}"
+    sys.path.insert(0, ROOT)
+    seed(args)
+
+
+if __name__ == "__main__":
+    main()
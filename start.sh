@@ -3,5 +3,11 @@
 # Python виртуалды ортаны активтендіру
 source venv/bin/activate
 
+# ASYNC_DB=1 болса AsyncSession-ға негізделген қосымша іске қосылады
+APP_MODULE="app.main:app"
+if [ "$ASYNC_DB" = "1" ]; then
+    APP_MODULE="app.async_main:app"
+fi
+
 # Uvicorn-ды тікелей шақыру
-python -m uvicorn app.main:app --host 0.0.0.0 --port $PORT
\ No newline at end of file
+python -m uvicorn "$APP_MODULE" --host 0.0.0.0 --port $PORT